@@ -1,6 +1,217 @@
 from pathlib import Path
-from csv import DictReader
+from csv import DictReader, DictWriter, reader as csv_reader, writer as csv_writer
+from array import array
+from collections import deque, OrderedDict
+from heapq import nlargest
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import argparse
+import asyncio
+import json
 import textwrap
+import threading
+import re
+import os
+import sys
+import hashlib
+import sqlite3
+import tempfile
+import zlib
+from time import perf_counter_ns
+from itertools import islice
+
+LEXICON_DIR = Path(__file__).parent.absolute() / 'address_bleach'
+DIRECTIONAL_WORDS = {'NORTH': 'N', 'SOUTH': 'S', 'EAST': 'E', 'WEST': 'W', 'NORTHWEST': 'NW',
+                     'NORTHEAST': 'NE', 'SOUTHWEST': 'SW', 'SOUTHEAST': 'SE'}
+DIRECTIONALS = frozenset(DIRECTIONAL_WORDS) | frozenset(DIRECTIONAL_WORDS.values())
+ADDRESS_COLUMNS = ('address', 'city', 'state', 'zipcode')
+DETAIL_KEYS = ('grid', 'street_block', 'street_num', 'street_body', 'street_suffix',
+               'street_directional', 'suite_num', 'box_num')
+PARSED_FIELDS = ('grid', 'street_block', 'street_num', 'street_body', 'street_suffix',
+                 'street_directional', 'suite_num', 'box_num', 'pobox_sts')
+COMPARE_FIELDS = ('Match_Status', 'Address1_Body_Score', 'Address2_Body_Score', 'Zip5_Match',
+                  'City_Match', 'Directional_Match', 'Ste_Match')
+IO_BUFFER = 1 << 20
+DEFAULT_WDIR = str(Path.cwd())
+EXCEPTION_FILE = 'AddressBleach_LoggedExceptions.csv'
+_lexicon = None
+_lexicon_lock = threading.Lock()
+_worker_kwargs = {}
+_instrumentation = None
+_exception_sink = None
+
+
+class Lexicon:
+    """ Suite and suffix identifier tables used by the address breakdown.
+        Each CSV is read once when the Lexicon is built; the resulting lookups are
+        shared by every Address using it.
+        ste_ids: suite identifiers in file order (tuple)
+        ste_rank: suite identifier -> last position in ste_ids (dict)
+        ste_pattern: single-scan regex over all suite identifiers (re.Pattern)
+        sfx_ids: suffix value -> USPS conversion (dict)
+        version: sha1 of both identifier files, to spot stale stored breakdowns (str)"""
+
+    def __init__(self, ste_identifiers=None, sfx_identifiers=None):
+        self.files = {'ste_identifiers': str(Path(ste_identifiers or LEXICON_DIR
+                                                   / 'ste_identifiers.csv')),
+                      'sfx_identifiers': str(Path(sfx_identifiers or LEXICON_DIR
+                                                   / 'suffix_identifiers.csv'))}
+        with open(self.files['ste_identifiers'], 'r') as si_in:
+            si_rdr = DictReader(si_in)
+            self.ste_ids = tuple(x['Identifier'] for x in si_rdr)
+        with open(self.files['sfx_identifiers'], 'r') as sfx_in:
+            sfx_rdr = DictReader(sfx_in)
+            self.sfx_ids = {x['Value']: x['Conversion'] for x in sfx_rdr}
+        self._wdir_files = {}
+        version = hashlib.sha1()
+        for key in ('ste_identifiers', 'sfx_identifiers'):
+            with open(self.files[key], 'rb') as id_in:
+                version.update(id_in.read())
+        self.version = version.hexdigest()
+        # The breakdown keeps the last identifier (in file order) found in the address.  Trying
+        # alternatives highest rank first means each position reports its best identifier, so
+        # the overall winner falls out of one scan.
+        self.ste_rank = {identifier: n for n, identifier in enumerate(self.ste_ids)}
+        by_rank = sorted(self.ste_rank, key=self.ste_rank.get, reverse=True)
+        self.ste_pattern = re.compile('(?=(' + '|'.join(re.escape(x) for x in by_rank) + '))')
+
+    def __reduce__(self):
+        # Addresses sent between processes (AddressService pools) unpickle onto the receiving
+        # process's Lexicon when the tables match, instead of each carrying a copy.
+        return _unpickle_lexicon, (self.files['ste_identifiers'], self.files['sfx_identifiers'],
+                                   self.version)
+
+    def files_for(self, wdir):
+        """ Address.files for a working directory, built once and shared by every Address
+        using this Lexicon and wdir.  Returns dict(). """
+        files = self._wdir_files.get(wdir)
+        if files is None:
+            files = {**self.files,
+                     'exception': str(Path(wdir) / EXCEPTION_FILE)}
+            self._wdir_files[wdir] = files
+        return files
+
+
+def get_lexicon():
+    """ Returns the process-wide Lexicon, loading the bundled identifier CSVs on first use. """
+    global _lexicon
+    if _lexicon is None:
+        with _lexicon_lock:
+            if _lexicon is None:
+                _lexicon = Lexicon()
+    return _lexicon
+
+
+def _unpickle_lexicon(ste_identifiers, sfx_identifiers, version):
+    """ The process-wide Lexicon if it has version, else one loaded from the CSVs. """
+    lexicon = get_lexicon()
+    if lexicon.version != version:
+        lexicon = Lexicon(ste_identifiers, sfx_identifiers)
+    return lexicon
+
+
+def load_lexicon(ste_identifiers=None, sfx_identifiers=None):
+    """ (Re)loads the process-wide Lexicon.  Pass custom CSV paths to override the bundled
+        identifier tables, or nothing to reload the defaults.  Addresses built afterwards use
+        the new tables.  Returns Lexicon. """
+    global _lexicon
+    lexicon = Lexicon(ste_identifiers, sfx_identifiers)
+    with _lexicon_lock:
+        _lexicon = lexicon
+    return lexicon
+
+
+class Instrumentation:
+    """ Per-stage timings and counters for the breakdown pipeline.  Installed with
+        enable_instrumentation; while it is not installed the pipeline only pays for one
+        None check per stage.
+        Stages: find_suite, grid_block, find_street_num, identify_street_suffix, find_directional
+        Counters: remove_found_types_key_errors, directional_exceptions
+        callback(name, value) is called with elapsed nanoseconds for each stage and with the
+        increment for each counter.  Safe to record from several threads (AddressService
+        executors) while another takes a snapshot. """
+
+    def __init__(self, callback=None, sample_size=10000):
+        self.callback = callback
+        self.sample_size = sample_size
+        self.calls = {}
+        self.total_ns = {}
+        self.samples = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def lap(self, stage, start):
+        """ Records the time since start against stage.  Returns the current clock (ns) so the
+        next stage can be timed from it. """
+        now = perf_counter_ns()
+        elapsed = now - start
+        with self._lock:
+            self.calls[stage] = self.calls.get(stage, 0) + 1
+            self.total_ns[stage] = self.total_ns.get(stage, 0) + elapsed
+            if stage not in self.samples:
+                self.samples[stage] = deque(maxlen=self.sample_size)
+            self.samples[stage].append(elapsed)
+        if self.callback is not None:
+            self.callback(stage, elapsed)
+        return now
+
+    def count(self, counter, increment=1):
+        """ Adds increment to counter. """
+        if increment:
+            with self._lock:
+                self.counters[counter] = self.counters.get(counter, 0) + increment
+            if self.callback is not None:
+                self.callback(counter, increment)
+
+    def reset(self):
+        """ Clears all timings and counters. """
+        with self._lock:
+            self.calls.clear()
+            self.total_ns.clear()
+            self.samples.clear()
+            self.counters.clear()
+
+    def snapshot(self):
+        """ Returns dict:
+        stages: stage -> calls, total_ms, mean_us and p50_us/p90_us/p99_us over the most recent
+                sample_size calls (dict)
+        counters: counter -> count (dict)"""
+        with self._lock:
+            recorded = [(stage, calls, self.total_ns[stage], list(self.samples[stage]))
+                        for stage, calls in self.calls.items()]
+            counters = dict(self.counters)
+        stages = {}
+        for stage, calls, total_ns, samples in recorded:
+            ordered = sorted(samples)
+
+            def percentile(p):
+                return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] / 1000, 2)
+
+            stages[stage] = {'calls': calls, 'total_ms': round(total_ns / 1e6, 3),
+                             'mean_us': round(total_ns / calls / 1000, 2),
+                             'p50_us': percentile(0.50), 'p90_us': percentile(0.90),
+                             'p99_us': percentile(0.99)}
+        return {'stages': stages, 'counters': counters}
+
+
+def enable_instrumentation(callback=None, sample_size=10000):
+    """ Starts recording breakdown stage timings in this process.  Returns Instrumentation. """
+    global _instrumentation
+    _instrumentation = Instrumentation(callback, sample_size)
+    return _instrumentation
+
+
+def disable_instrumentation():
+    """ Stops recording.  Returns the Instrumentation that was installed, or None. """
+    global _instrumentation
+    instrumentation, _instrumentation = _instrumentation, None
+    return instrumentation
+
+
+def instrumentation_snapshot():
+    """ Current Instrumentation.snapshot(), or an empty one when disabled.  Returns dict. """
+    if _instrumentation is None:
+        return {'stages': {}, 'counters': {}}
+    return _instrumentation.snapshot()
 
 
 def compare(address1, address2):
@@ -110,33 +321,672 @@ def compare(address1, address2):
     return comparison_decision
 
 
+class Fingerprint:
+    """ Everything compare looks at, normalized once: uppercased state/city, zip3/zip5, the
+        street keys and the street_body tokens as a set and count.  Normalized values and body
+        tokens are interned, the street keys are the address's own strings, and the token list
+        is only kept (body_tokens) when the body repeats a token; otherwise it is None. """
+
+    __slots__ = ('pobox_sts', 'state', 'city', 'zip3', 'zip5', 'box_num', 'street_num',
+                 'street_block', 'grid', 'street_directional', 'suite_num', 'body_tokens',
+                 'body_set', 'body_size', 'body_unique')
+
+    def __init__(self, address):
+        details = address.address_details
+        self.pobox_sts = address.pobox_sts
+        self.state = sys.intern(address.state.upper())
+        self.city = sys.intern(address.city.upper())
+        self.zip3 = sys.intern(address.zipcode[:3])
+        self.zip5 = sys.intern(address.zipcode[:5])
+        self.box_num = details['box_num']
+        self.street_num = details['street_num']
+        self.street_block = details['street_block']
+        self.grid = details['grid']
+        self.street_directional = details['street_directional']
+        self.suite_num = details['suite_num']
+        body_tokens = [sys.intern(t) for t in details['street_body'].split(' ')]
+        self.body_set = frozenset(body_tokens)
+        self.body_size = len(body_tokens)
+        self.body_unique = self.body_size == len(self.body_set)
+        self.body_tokens = None if self.body_unique else body_tokens
+
+
+def _body_scores(fp1, fp2):
+    """ Both directions of compare's addr_body_compare from one set intersection.
+    Returns (float, float). """
+    shared = len(fp1.body_set & fp2.body_set)
+    ct1 = shared if fp1.body_unique else sum(t in fp2.body_set for t in fp1.body_tokens)
+    ct2 = shared if fp2.body_unique else sum(t in fp1.body_set for t in fp2.body_tokens)
+    return round(100 * ct1 / fp1.body_size, 0), round(100 * ct2 / fp2.body_size, 0)
+
+
+def _compare_fingerprints(fp1, fp2):
+    """ compare, evaluated on Fingerprints with the cheap rejections first.  Returns dict. """
+    if fp1.pobox_sts and fp2.pobox_sts:
+        if fp1.box_num == fp2.box_num and fp1.state == fp2.state:
+            return {'Match_Status': 'Match', 'Address1_Body_Score': 100,
+                    'Address2_Body_Score': 100, 'Zip5_Match': fp1.zip5 == fp2.zip5,
+                    'City_Match': fp1.city == fp2.city, 'Directional_Match': False,
+                    'Ste_Match': False}
+    elif (not fp1.pobox_sts and not fp2.pobox_sts and fp1.state == fp2.state
+          and fp1.zip3 == fp2.zip3 and fp1.street_num == fp2.street_num
+          and fp1.street_block == fp2.street_block and fp1.grid == fp2.grid
+          and (fp1.suite_num == fp2.suite_num or not fp1.suite_num or not fp2.suite_num)):
+        addr1_body_score, addr2_body_score = _body_scores(fp1, fp2)
+        zip5_match = fp1.zip5 == fp2.zip5
+        city_match = fp1.city == fp2.city
+        if addr1_body_score == 0 or addr2_body_score == 0:
+            match_status = 'No Match'
+        elif zip5_match or city_match or (addr1_body_score == 100.0
+                                          and addr2_body_score == 100.0):
+            match_status = 'Match'
+        else:
+            match_status = 'Potential'
+        return {'Match_Status': match_status, 'Address1_Body_Score': addr1_body_score,
+                'Address2_Body_Score': addr2_body_score, 'Zip5_Match': zip5_match,
+                'City_Match': city_match,
+                'Directional_Match': fp1.street_directional == fp2.street_directional,
+                'Ste_Match': fp1.suite_num == fp2.suite_num}
+    return _no_match()
+
+
+def _no_match():
+    return {'Match_Status': 'No Match', 'Address1_Body_Score': 0, 'Address2_Body_Score': 0,
+            'Zip5_Match': False, 'City_Match': False, 'Directional_Match': False,
+            'Ste_Match': False}
+
+
+def compare_many(address, candidates):
+    """ compare(address, candidate) for every candidate, using each side's cached
+    fingerprint so nothing is re-uppercased or re-split per pair.  Candidates without a
+    cached fingerprint (CompactAddress never caches one) are first checked on PO Box status
+    and state, so lazy candidates that can't match are never broken down.
+    Returns list() of comparison_decision dicts (same schema as compare), in candidate order. """
+    probe = address.fingerprint
+    decisions = []
+    for candidate in candidates:
+        if getattr(candidate, '_fingerprint', None) is None \
+                and (candidate.pobox_sts != probe.pobox_sts
+                     or candidate.state.upper() != probe.state):
+            decisions.append(_no_match())
+        else:
+            decisions.append(_compare_fingerprints(probe, candidate.fingerprint))
+    return decisions
+
+
+def blocking_key(address):
+    """ Key that two addresses must share for compare to return anything but 'No Match'.
+        PO Boxes: state and box number.
+        Street addresses: state, 3-digit zip, street number, block and grid.
+        Returns tuple. """
+    if address.pobox_sts:
+        return ('PO', address.state.upper(), address.address_details['box_num'])
+    return ('ST', address.state.upper(), address.zipcode[:3],
+            address.address_details['street_num'], address.address_details['street_block'],
+            address.address_details['grid'])
+
+
+class AddressIndex:
+    """ Buckets parsed Address objects by blocking_key so a lookup only runs compare against
+        addresses that could possibly match, instead of the whole reference set.  A bucket's
+        Fingerprints are built the first time it is queried and kept beside it, so
+        CompactAddress reference sets aren't re-split on every query.  Addresses are keyed and
+        fingerprinted as they are when indexed; re-index one after editing it. """
+
+    def __init__(self, addresses=()):
+        self.buckets = {}
+        self.fingerprints = {}
+        self.size = 0
+        for address in addresses:
+            self.add(address)
+
+    def __len__(self):
+        return self.size
+
+    def add(self, address):
+        """ Adds an Address to its bucket. """
+        key = blocking_key(address)
+        self.buckets.setdefault(key, []).append(address)
+        fingerprints = self.fingerprints.get(key)
+        if fingerprints is not None:
+            fingerprints.append(address.fingerprint)
+        self.size += 1
+
+    def candidates(self, address):
+        """ Indexed addresses sharing the blocking key of address.  Returns list(). """
+        return self.buckets.get(blocking_key(address), [])
+
+    def query(self, address, statuses=('Match', 'Potential')):
+        """ Runs compare between address and its candidates.
+        Returns list() of (candidate, comparison_decision) whose Match_Status is in statuses. """
+        found = []
+        key = blocking_key(address)
+        candidates = self.buckets.get(key)
+        if not candidates:
+            return found
+        fingerprints = self.fingerprints.get(key)
+        if fingerprints is None:
+            fingerprints = self.fingerprints[key] = [c.fingerprint for c in candidates]
+        probe = address.fingerprint
+        for candidate, fingerprint in zip(candidates, fingerprints):
+            decision = _compare_fingerprints(probe, fingerprint)
+            if decision['Match_Status'] in statuses:
+                found.append((candidate, decision))
+        return found
+
+
+class ExceptionSink:
+    """ Shared, buffered collector for Address exception records.  Records go to the exceptions
+        CSV they are recorded for (Address.files['exception'], which follows its wdir), or
+        all to path when one is given.  Identical records are kept as one row with a running
+        Count for the life of the sink, and each flush rewrites every changed report in full, so
+        a report describes this sink's run; with append=True counts start from the report
+        already on disk instead.  writer(path, rows) replaces the CSV writer.  Flushes happen
+        once batch_size records (at least as many as there are distinct rows) have arrived
+        since the last one, or, with background=True, from a writer thread every
+        flush_interval seconds.
+        Use as a context manager, or call close(), to flush what is left. """
+
+    fieldnames = ('Address', 'City', 'State', 'Zip', 'Exception', 'Count')
+
+    def __init__(self, path=None, writer=None, batch_size=1000, background=False,
+                 flush_interval=1.0, append=False):
+        self.path = str(path) if path else None
+        self.writer = writer or self._write_csv
+        self.append = append
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.totals = {}
+        self.changed = set()
+        self.distinct = 0
+        self.unflushed = 0
+        self.recorded = 0
+        self.written = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = None
+        if background:
+            self._thread = threading.Thread(target=self._run, name='address_bleach-exceptions',
+                                            daemon=True)
+            self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def record(self, exception, path=None):
+        """ Buffers one exception record (dict with the fieldnames other than Count). """
+        self.record_many([exception], path)
+
+    def record_many(self, exceptions, path=None):
+        """ Buffers exception records bound for the exceptions CSV at path (default: the one in
+        DEFAULT_WDIR), flushing once enough have arrived. """
+        path = self.path or path or str(Path(DEFAULT_WDIR) / EXCEPTION_FILE)
+        with self._lock:
+            counts = self.totals.get(path)
+            if counts is None:
+                counts = self.totals[path] = self._existing(path)
+                self.distinct += len(counts)
+            for exception in exceptions:
+                key = tuple(exception.get(f, '') for f in self.fieldnames[:-1])
+                if key not in counts:
+                    self.distinct += 1
+                counts[key] = counts.get(key, 0) + 1
+                self.recorded += 1
+                self.unflushed += 1
+            self.changed.add(path)
+            due = self.unflushed >= max(self.batch_size, self.distinct)
+        if due and self._thread is not None:
+            self._wake.set()
+        elif due:
+            self.flush()
+
+    def flush(self):
+        """ Rewrites every report that changed since the last flush.
+        Returns number of rows written. """
+        with self._flush_lock:
+            with self._lock:
+                reports = [(path, list(self.totals[path].items())) for path in self.changed]
+                self.changed = set()
+                self.unflushed = 0
+            written = 0
+            for path, counts in reports:
+                rows = [dict(zip(self.fieldnames, key + (count,))) for key, count in counts]
+                self.writer(path, rows)
+                written += len(rows)
+            self.written += written
+        return written
+
+    def close(self):
+        """ Stops the writer thread, if any, and flushes. """
+        self._closed = True
+        if self._thread is not None:
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def _existing(self, path):
+        """ Counts already in the report at path, when appending to CSVs.  Returns dict(). """
+        counts = {}
+        if self.append and self.writer == self._write_csv and Path(path).exists():
+            with open(path, 'r', newline='') as f_in:
+                for row in DictReader(f_in):
+                    key = tuple(row.get(f) or '' for f in self.fieldnames[:-1])
+                    counts[key] = counts.get(key, 0) + int(row.get('Count') or 1)
+        return counts
+
+    def _write_csv(self, path, rows):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', newline='', buffering=IO_BUFFER) as f_out:
+            writer = DictWriter(f_out, fieldnames=self.fieldnames)
+            writer.writeheader()
+            writer.writerows(rows)
+        os.replace(tmp_path, path)
+
+
+def get_exception_sink():
+    """ Returns the process-wide ExceptionSink, or None. """
+    return _exception_sink
+
+
+def set_exception_sink(sink):
+    """ Installs sink as the process-wide ExceptionSink used by every Address that isn't
+    given one (None to stop).  Returns the previous sink, which is not closed. """
+    global _exception_sink
+    previous, _exception_sink = _exception_sink, sink
+    return previous
+
+
+class FuzzyIndex:
+    """ Inverted index for fuzzy lookups when compare's exact keys (street number, zip3, ...)
+        can't be trusted.  Each address is indexed under its street_body tokens, character
+        n-grams of the street_body, its street/box number and that number's digit pairs (so a
+        one-digit typo still overlaps), suffix, suite, city and zip5.  nearest()
+        scores candidates by weighted Dice overlap of those terms (1.0 = identical terms).
+        Terms posted for more than max_postings addresses are too common to tell candidates
+        apart and are skipped while scoring. """
+
+    weights = {'token': 1.0, 'gram': 0.3, 'num': 1.0, 'num_gram': 0.2, 'suffix': 0.3,
+               'suite': 0.5, 'city': 0.5, 'zip': 0.5}
+
+    def __init__(self, addresses=(), ngram=3, max_postings=100000):
+        self.ngram = ngram
+        self.max_postings = max_postings
+        self.addresses = []
+        self.term_weights = array('d')
+        self.postings = {}
+        for address in addresses:
+            self.add(address)
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def terms(self, address):
+        """ Indexed terms of address.  Returns dict: (kind, value) -> weight. """
+        details = address.address_details
+        body = details['street_body'].upper()
+        terms = {('token', t): self.weights['token'] for t in body.split(' ') if t}
+        if body:
+            padded = f' {body} '
+            for n in range(len(padded) - self.ngram + 1):
+                terms[('gram', padded[n:n + self.ngram])] = self.weights['gram']
+        number = details['box_num'].strip() if address.pobox_sts else details['street_num']
+        for n in range(len(number) - 1):
+            terms[('num_gram', number[n:n + 2])] = self.weights['num_gram']
+        for kind, value in (('num', number), ('suffix', details['street_suffix']),
+                            ('suite', details['suite_num']), ('city', address.city.upper()),
+                            ('zip', address.zipcode[:5])):
+            if value:
+                terms[(kind, value)] = self.weights[kind]
+        return terms
+
+    def add(self, address):
+        """ Indexes an Address (or CompactAddress). """
+        doc_id = len(self.addresses)
+        terms = self.terms(address)
+        self.addresses.append(address)
+        self.term_weights.append(sum(terms.values()))
+        for term in terms:
+            if term not in self.postings:
+                self.postings[term] = array('l')
+            self.postings[term].append(doc_id)
+
+    def nearest(self, address, k=10):
+        """ Top-k indexed addresses most similar to address.
+        Returns list() of (address, score) with score between 0 and 1, best first. """
+        terms = self.terms(address)
+        query_weight = sum(terms.values())
+        shared = {}
+        for term, weight in terms.items():
+            doc_ids = self.postings.get(term)
+            if doc_ids is None or len(doc_ids) > self.max_postings:
+                continue
+            for doc_id in doc_ids:
+                shared[doc_id] = shared.get(doc_id, 0.0) + weight
+        term_weights = self.term_weights
+        scored = ((2 * weight / (query_weight + term_weights[doc_id]), doc_id)
+                  for doc_id, weight in shared.items())
+        return [(self.addresses[doc_id], round(score, 4))
+                for score, doc_id in nlargest(k, scored)]
+
+
+class _UnionFind:
+    """ Disjoint sets over 0..size-1 (path halving, union by size). """
+
+    def __init__(self, size):
+        self.parent = list(range(size))
+        self.size = [1] * size
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a, b):
+        """ Joins the sets holding a and b.  Returns False if they were already joined. """
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return False
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        return True
+
+
+def _dedupe_block(members, statuses, cluster_ids, representatives):
+    """ Clusters one block of (row, address) members in row order.  Writes cluster ids and
+    representatives in place.  Returns number of comparisons run. """
+    clusters = _UnionFind(len(members))
+    comparisons = 0
+    fingerprints = [Fingerprint(address) for _, address in members]
+    for i in range(len(members)):
+        for j in range(i + 1, len(members)):
+            if clusters.find(i) == clusters.find(j):
+                continue
+            comparisons += 1
+            if _compare_fingerprints(fingerprints[i], fingerprints[j])['Match_Status'] \
+                    in statuses:
+                clusters.union(i, j)
+    grouped = {}
+    for i, member in enumerate(members):
+        grouped.setdefault(clusters.find(i), []).append(member)
+    for group in grouped.values():
+        cluster_id = group[0][0]
+        for row, _ in group:
+            cluster_ids[row] = cluster_id
+        if len(group) > 1:
+            representatives[cluster_id] = \
+                max(group, key=lambda m: (sum(bool(v) for v in m[1].details), -m[0]))[0]
+    return comparisons
+
+
+def dedupe(addresses, include_potential=False, shards=64, shard_dir=None):
+    """ Clusters duplicate addresses within one dataset.  addresses may be any iterable of
+    Address/CompactAddress; pass a generator so they aren't all held at once.  Each address
+    is spilled to one of shards files on disk by blocking_key, then shards are loaded one at a
+    time, compare runs only inside each block, and every 'Match' (plus 'Potential' if
+    include_potential) joins the pair's clusters.  Pairs already in one cluster are not
+    compared again.  Memory is bounded by the largest shard plus one integer per row (and one
+    entry per duplicate cluster).
+    shard_dir: where shard files go (default: a temporary directory, removed afterwards)
+    Returns dict:
+    cluster_ids: cluster id per input row; the id is the cluster's lowest row number (array)
+    representatives: cluster id -> row number of the member with the most populated
+                     address_details (ties go to the earliest row), for clusters of 2+ rows
+                     (dict)
+    summary: rows, clusters, duplicate_clusters, duplicate_rows, comparisons (dict)"""
+    statuses = ('Match', 'Potential') if include_potential else ('Match',)
+    representatives = {}
+    comparisons = 0
+    rows = 0
+    with tempfile.TemporaryDirectory(dir=shard_dir) as tmp_dir:
+        shard_paths = [str(Path(tmp_dir) / f'dedupe_{n}.csv') for n in range(shards)]
+        handles = [open(p, 'w', newline='', buffering=IO_BUFFER // 16) for p in shard_paths]
+        try:
+            writers = [csv_writer(h) for h in handles]
+            for rows, address in enumerate(addresses, 1):
+                key = '\x1f'.join(blocking_key(address))
+                details = address.address_details
+                writers[zlib.crc32(key.encode('utf-8')) % shards].writerow(
+                    (rows - 1, address.address, address.city, address.state, address.zipcode,
+                     int(address.pobox_sts)) + tuple(details[k] for k in DETAIL_KEYS))
+        finally:
+            for handle in handles:
+                handle.close()
+        cluster_ids = array('q', range(rows))
+        for shard_path in shard_paths:
+            blocks = {}
+            with open(shard_path, 'r', newline='', buffering=IO_BUFFER) as shard_in:
+                for row in csv_reader(shard_in):
+                    address = CompactAddress(row[1], row[2], row[3], row[4], row[5] == '1',
+                                             row[6:])
+                    blocks.setdefault(blocking_key(address), []).append((int(row[0]), address))
+            for members in blocks.values():
+                if len(members) > 1:
+                    comparisons += _dedupe_block(members, statuses, cluster_ids,
+                                                 representatives)
+    duplicate_clusters = len(representatives)
+    clusters_total = rows - sum(1 for row, cluster_id in enumerate(cluster_ids)
+                                if row != cluster_id)
+    return {'cluster_ids': cluster_ids, 'representatives': representatives,
+            'summary': {'rows': rows, 'clusters': clusters_total,
+                        'duplicate_clusters': duplicate_clusters,
+                        'duplicate_rows': rows - clusters_total, 'comparisons': comparisons}}
+
+
+class ParseCache:
+    """ Opt-in LRU cache of address breakdowns, passed to Address(..., cache=ParseCache()).
+        Keys are the exact raw (address, city, state, zipcode) plus the Lexicon version and
+        engine, since the breakdown keeps the input's letter case and spacing: a hit returns
+        exactly what a fresh parse would.  One cache may be shared across Lexicons/engines. """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getstate__(self):
+        # Locks don't pickle; pool workers (parse_parallel) each get their own copy.
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(address, city, state, zipcode, version='', legacy=False):
+        """ Cache key for raw fields parsed with Lexicon version by the legacy or compiled
+        engine.  Returns tuple. """
+        return version, bool(legacy), address, city, state, zipcode
+
+    def get(self, key):
+        """ Cached (pobox_sts, details, exceptions) for key, or None. """
+        with self._lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        """ Stores value, evicting the least recently used entries beyond maxsize. """
+        with self._lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """ Drops every entry and resets the statistics. """
+        with self._lock:
+            self.entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """ Returns dict: hits, misses, evictions, size, maxsize. """
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'size': len(self.entries), 'maxsize': self.maxsize}
+
+
+class _Details(dict):
+    """ Address.address_details: a dict that drops its Address's cached Fingerprint when
+        edited in place. """
+
+    __slots__ = ('owner',)
+
+    def _changed(self):
+        owner = getattr(self, 'owner', None)
+        if owner is not None:
+            owner._fingerprint = None
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._changed()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._changed()
+
+    def __ior__(self, other):
+        super().__ior__(other)
+        self._changed()
+        return self
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._changed()
+
+    def setdefault(self, key, default=None):
+        value = super().setdefault(key, default)
+        self._changed()
+        return value
+
+    def pop(self, *args):
+        value = super().pop(*args)
+        self._changed()
+        return value
+
+    def popitem(self):
+        item = super().popitem()
+        self._changed()
+        return item
+
+    def clear(self):
+        super().clear()
+        self._changed()
+
+
 class Address:
     """ Address Object for address_bleach, which is intended to make
         the cleanup and comparison of address data much easier by
         breaking the data down into more manageable components."""
 
-    def __init__(self, address, city, state, zipcode, wdir=str(Path.cwd())):
+    def __init__(self, address, city, state, zipcode, wdir=DEFAULT_WDIR, lexicon=None,
+                 legacy=False, cache=None, exception_sink=None, lazy=False):
 
         self.address = address
         self.city = city
         self.state = state
         self.zipcode = zipcode
         self.pobox_sts = False
-        self.address_details = \
+        self._address_details = self._details(
             {'grid': '', 'street_block': '', 'street_num': '', 'street_body': '',
-             'street_suffix': '', 'street_directional': '', 'suite_num': '', 'box_num': ''}
+             'street_suffix': '', 'street_directional': '', 'suite_num': '', 'box_num': ''})
         # Files/Exceptions
-        self.files = {'ste_identifiers': str(Path(__file__).parent.absolute())
-                      + '\\address_bleach\\ste_identifiers.csv',
-                      'sfx_identifiers': str(Path(__file__).parent.absolute())
-                      + '\\address_bleach\\suffix_identifiers.csv',
-                      'exception': wdir + '\\AddressBleach_LoggedExceptions.csv'}
+        self.lexicon = lexicon or get_lexicon()
+        self.files = self.lexicon.files_for(wdir)
         self.exceptions = []
-        # Perform evaluation and breakdown
-        self.pobox_sts, self.address_details['box_num'] = self.is_pobox()
-        if not self.pobox_sts:
-            self.address_details, self.exceptions = \
-                self.breakdown_details(dict(), self.address_details['box_num'])
+        self._fingerprint = None
+        self._deferred = None
+        # Cached breakdown, if this raw input has been seen before
+        cached = None
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.key(address, city, state, zipcode, self.lexicon.version, legacy)
+            cached = cache.get(cache_key)
+        if cached is not None:
+            self.pobox_sts = cached[0]
+            self._address_details = self._details(zip(DETAIL_KEYS, cached[1]))
+            self.exceptions = list(cached[2])
+            self._log_exceptions(exception_sink)
+        else:
+            # Perform evaluation and breakdown.  Lazy street addresses stop after the PO Box
+            # check; the breakdown runs on first access to address_details.
+            self.pobox_sts, self._address_details['box_num'] = self.is_pobox()
+            if lazy and not self.pobox_sts:
+                self._deferred = (legacy, cache, cache_key, exception_sink)
+            else:
+                self._complete(legacy, cache, cache_key, exception_sink)
+
+    @property
+    def address_details(self):
+        if self._deferred is not None:
+            deferred, self._deferred = self._deferred, None
+            self._complete(*deferred)
+        return self._address_details
+
+    @address_details.setter
+    def address_details(self, value):
+        self._deferred = None
+        self._fingerprint = None
+        self._address_details = self._details(value)
+
+    def _details(self, values):
+        """ address_details dict tied to this Address's Fingerprint.  Returns _Details. """
+        details = _Details(values)
+        details.owner = self
+        return details
+
+    @property
+    def evaluated(self):
+        """ False while a lazy Address is still waiting on its street breakdown. """
+        return self._deferred is None
+
+    def _complete(self, legacy, cache, cache_key, exception_sink):
+        """ Runs the street breakdown (if not a PO Box), then caches and logs the result. """
+        if not self.pobox_sts and legacy:
+            details, self.exceptions = \
+                self.breakdown_details(dict(), self._address_details['box_num'])
+            self._address_details = self._details(details)
+        elif not self.pobox_sts:
+            details, self.exceptions = self.compiled_breakdown(self._address_details['box_num'])
+            self._address_details = self._details(details)
+        if cache is not None:
+            cache.put(cache_key, (self.pobox_sts,
+                                  tuple(self._address_details[k] for k in DETAIL_KEYS),
+                                  tuple(self.exceptions)))
+        self._log_exceptions(exception_sink)
+
+    def _log_exceptions(self, exception_sink):
+        if self.exceptions:
+            exception_sink = exception_sink or _exception_sink
+            if exception_sink is not None:
+                exception_sink.record_many(self.exceptions, self.files['exception'])
 
     def __str__(self):
         details = f'''\
@@ -196,21 +1046,21 @@ class Address:
                     try:
                         breakdown_detail_dict.pop(key)
                     except KeyError as key_err:
-                        print(f'Address_Bleach: Key Error encountered: {self.address}'
-                              + f'{self.address_breakdown}, {key_err}, {r_list}')
+                        if inst is not None:
+                            inst.count('remove_found_types_key_errors')
+                        bd_exceptions.append({'Address': self.address, 'City': self.city,
+                                              'State': self.state, 'Zip': self.zipcode,
+                                              'Exception': f'Key Error encountered: {key_err}'})
             return set(), breakdown_detail_dict
 
-        def find_suite(full_address, suite_identifiers):
+        def find_suite(full_address, ste_ids):
             """ Identifies if address has suite.  Returns boolean. """
             found_ste = False
             found_value = ''
             ste_number = ''
-            # Load Suite Identifiers
-            with open(suite_identifiers, 'r') as si_in:
-                si_rdr = DictReader(si_in)
-                ste_ids = [x['Identifier'] for x in si_rdr]
+            upper_address = full_address.upper()
             for identifier in ste_ids:
-                if identifier in full_address.upper():
+                if identifier in upper_address:
                     found_ste = True
                     found_value = identifier
             if found_ste:
@@ -300,25 +1150,21 @@ class Address:
 
             return nums, ste_suffix, found_key
 
-        def identify_street_suffix(address_bd, suffix_identifiers):
+        def identify_street_suffix(address_bd, sfx_ids):
             '''Loops through the remaining items in Address Breakdown in reverse order searching for
             a valid suffix.  Those items are then checked against the values listed in
             suffix_identifiers.csv which is populated with translations provided by the USPS.
             Given that suffixes are at the end of the address, we're reversing the dict() order to
             get there faster and not accidentally capture a part of the street body by mistake
             first, such as with PEACEFUL TRAIL RD picking up TRAIL first.'''
-            with open(suffix_identifiers, 'r') as sfx_in:
-                sfx_rdr = DictReader(sfx_in)
-                sfx_ids = {x['Value']: x['Conversion'] for x in sfx_rdr}
             found_suffix = ''
             suffix_key = ''
             reverse_index_bd = dict(reversed(address_bd.items()))
             for element_key, element_value in reverse_index_bd.items():
-                for suffix_value, suffix_abbreviation in sfx_ids.items():
-                    if element_value.upper() == suffix_value:
-                        found_suffix = suffix_abbreviation
-                        suffix_key = element_key
-                        break
+                suffix_abbreviation = sfx_ids.get(element_value.upper())
+                if suffix_abbreviation is not None:
+                    found_suffix = suffix_abbreviation
+                    suffix_key = element_key
 
             return found_suffix, suffix_key
 
@@ -368,7 +1214,7 @@ class Address:
             elif len(potentials) == 1:
                 directional_key = min(potential_keys)
                 directional_val = potentials[min(potential_keys)]
-            else:
+            elif len(potentials) > 2:
                 # More than 2 directionals observed...document it and figure out why it exists
                 # In case it's not evident, this shouldn't occur
                 exceptions\
@@ -380,6 +1226,8 @@ class Address:
             return directional_val, directional_key, exceptions
 
         # Begin Address Breakdown #
+        inst = _instrumentation
+        lap_start = perf_counter_ns() if inst is not None else 0
         removals = set()
         bd_exceptions = []
         # Build breakdown dictionary #
@@ -387,7 +1235,7 @@ class Address:
             bd_dict[n] = element
         # Check for Suite Numbers #
         body_ste_chk, body_ste_id, addr_ste_num = \
-            find_suite(self.address, self.files['ste_identifiers'])
+            find_suite(self.address, self.lexicon.ste_ids)
         if body_ste_chk:
             # Assign breakdown removals
             for ste_k, ste_v in bd_dict.items():
@@ -401,6 +1249,8 @@ class Address:
         else:
             pass
         removals, bd_dict = remove_found_types(removals, bd_dict)
+        if inst is not None:
+            lap_start = inst.lap('find_suite', lap_start)
 
         # Identification of Grid and Block address elements.
         block_status = False
@@ -415,6 +1265,8 @@ class Address:
                 street_block = gb_v
                 removals.add(gb_k)
         removals, bd_dict = remove_found_types(removals, bd_dict)
+        if inst is not None:
+            lap_start = inst.lap('grid_block', lap_start)
 
         # Identification of Street Number and, if applicable, Ste Number
         street_number, potential_ste, key = find_street_num(bd_dict, block_status, bool(grid_id))
@@ -423,16 +1275,24 @@ class Address:
         if not addr_ste_num and potential_ste:
             addr_ste_num = potential_ste
         removals, bd_dict = remove_found_types(removals, bd_dict)
+        if inst is not None:
+            lap_start = inst.lap('find_street_num', lap_start)
 
-        street_suffix, suff_key = identify_street_suffix(bd_dict, self.files['sfx_identifiers'])
+        street_suffix, suff_key = identify_street_suffix(bd_dict, self.lexicon.sfx_ids)
         removals.add(suff_key)
         removals, bd_dict = remove_found_types(removals, bd_dict)
+        if inst is not None:
+            lap_start = inst.lap('identify_street_suffix', lap_start)
 
         # Identification of Directional
-        street_directional, match_key, bd_exceptions = find_directional(bd_dict)
+        street_directional, match_key, dir_exceptions = find_directional(bd_dict)
+        bd_exceptions.extend(dir_exceptions)
         if match_key:
             removals.add(match_key)
             remove_found_types(removals, bd_dict)
+        if inst is not None:
+            inst.lap('find_directional', lap_start)
+            inst.count('directional_exceptions', len(dir_exceptions))
 
         # Compile Body
         street_body = ' '.join(bd_dict.values())
@@ -444,8 +1304,920 @@ class Address:
 
         return addr_deets, bd_exceptions
 
+    def compiled_breakdown(self, box_num):
+        """ Single-pass equivalent of breakdown_details.  The address is uppercased and split
+        once, suites are found with the Lexicon's compiled pattern, and suffixes/directionals
+        are plain dict lookups.  Output matches breakdown_details (use legacy=True on Address to
+        run the original pipeline for comparison).
+        Returns dict(), list(). """
+        lexicon = self.lexicon
+        inst = _instrumentation
+        lap_start = perf_counter_ns() if inst is not None else 0
+        tokens = self.address.split(' ')
+        uppers = self.address.upper().split(' ')
+        remaining = list(range(len(tokens)))
+        exceptions = []
+
+        # Suite: highest ranked identifier present in the address
+        addr_ste_num = ''
+        upper_address = self.address.upper()
+        found = [m.group(1) for m in lexicon.ste_pattern.finditer(upper_address)]
+        if found:
+            found_value = max(found, key=lexicon.ste_rank.get)
+            isolated_suite = self.address[upper_address.find(found_value) + len(found_value):]
+            iso_ste_index = isolated_suite.find(' ')
+            addr_ste_num = isolated_suite.replace('-', '')
+            if iso_ste_index != -1:
+                addr_ste_num = addr_ste_num[:iso_ste_index]
+            ste_id = found_value.strip()
+            remaining = [k for k in remaining
+                         if not (uppers[k] == ste_id or tokens[k] == addr_ste_num
+                                 or ste_id in tokens[k])]
+        if inst is not None:
+            lap_start = inst.lap('find_suite', lap_start)
+
+        # Grid / Block: only the first two positions can qualify
+        grid_id = ''
+        street_block = ''
+        for k in [k for k in remaining[:2] if k <= 1]:
+            v = tokens[k]
+            alpha_ct = sum(c.isalpha() for c in v)
+            if k == 0 and (('-' not in v and alpha_ct == 2) or '.' in v):
+                grid_id = v
+                remaining.remove(k)
+            elif '-' in v and alpha_ct == 0 and len(v.split('-')[1]) >= 2:
+                street_block = v
+                remaining.remove(k)
+        if inst is not None:
+            lap_start = inst.lap('grid_block', lap_start)
+
+        # Street Number and, if applicable, Ste suffix
+        street_number = ''
+        if not street_block:
+            num_key = 1 if grid_id else 0
+            if num_key in remaining and any(c.isdigit() for c in tokens[num_key]):
+                temp_val = tokens[num_key]
+                street_number = ''.join(c for c in temp_val.split('-')[0] if c.isdigit())
+                # Without a number, the original loop runs on and leaves the last value behind.
+                v = temp_val if street_number else tokens[remaining[-1]]
+                if street_number:
+                    remaining.remove(num_key)
+                if temp_val.isalnum():
+                    potential_ste = ''.join(c for c in v if c.isalpha())
+                elif '-' in v:
+                    potential_ste = v.split('-')[1]
+                else:
+                    potential_ste = ''
+                if not addr_ste_num and potential_ste:
+                    addr_ste_num = potential_ste
+        if inst is not None:
+            lap_start = inst.lap('find_street_num', lap_start)
+
+        # Street Suffix: earliest remaining element that is a known suffix
+        street_suffix = ''
+        for k in remaining:
+            if uppers[k] in lexicon.sfx_ids:
+                street_suffix = lexicon.sfx_ids[uppers[k]]
+                remaining.remove(k)
+                break
+        if inst is not None:
+            lap_start = inst.lap('identify_street_suffix', lap_start)
+
+        # Directional
+        potential_keys = [k for k in remaining if uppers[k] in DIRECTIONALS]
+        directional_key = None
+        if len(potential_keys) == 2:
+            if potential_keys[1] - potential_keys[0] > 1:
+                directional_key = potential_keys[1]
+            else:
+                directional_key = potential_keys[0]
+        elif len(potential_keys) == 1:
+            directional_key = potential_keys[0]
+        elif len(potential_keys) > 2:
+            exceptions.append({'Address': self.address, 'City': self.city,
+                               'State': self.state, 'Zip': self.zipcode,
+                               'Exception': 'More than 2 potential Directionals exist in address.'})
+        street_directional = ''
+        if directional_key is not None:
+            street_directional = DIRECTIONAL_WORDS.get(uppers[directional_key],
+                                                       tokens[directional_key])
+            if directional_key:
+                remaining.remove(directional_key)
+        if inst is not None:
+            inst.lap('find_directional', lap_start)
+            inst.count('directional_exceptions', len(exceptions))
+
+        addr_deets = {'grid': grid_id, 'street_block': street_block, 'street_num': street_number,
+                      'street_body': ' '.join(tokens[k] for k in remaining),
+                      'street_suffix': street_suffix, 'street_directional': street_directional,
+                      'suite_num': addr_ste_num, 'box_num': box_num}
+
+        return addr_deets, exceptions
+
+    def parsed(self):
+        """ Flattened breakdown (address_details plus pobox_sts).  Returns dict(). """
+        return {**self.address_details, 'pobox_sts': self.pobox_sts}
+
+    @property
+    def fingerprint(self):
+        """ Comparison Fingerprint, built on first use and kept until address_details is
+        edited or replaced, or city, state, zipcode or pobox_sts is reassigned (checked here
+        rather than on assignment so reading those fields stays free).  Returns Fingerprint. """
+        source = (self.city, self.state, self.zipcode, self.pobox_sts)
+        if self._fingerprint is None or self._fingerprint_source != source:
+            self._fingerprint = Fingerprint(self)
+            self._fingerprint_source = source
+        return self._fingerprint
+
+    def compact(self):
+        """ Returns CompactAddress holding this breakdown. """
+        return CompactAddress.from_address(self)
+
+
+class CompactAddress:
+    """ Slotted, read-only form of a parsed Address for holding large reference sets in
+        memory.  The breakdown is stored as a tuple in DETAIL_KEYS order and short repeated
+        values (state, city, zip, suffix, directional, ...) are interned, so a few million
+        addresses share those strings.  address_details, __str__ and compare work as they do
+        on Address; files, lexicon and exceptions are not kept, and fingerprint is rebuilt on
+        each use rather than cached so the object stays small. """
+
+    __slots__ = ('address', 'city', 'state', 'zipcode', 'pobox_sts', 'details')
+    interned_keys = frozenset(['grid', 'street_block', 'street_suffix', 'street_directional',
+                               'suite_num'])
+
+    def __init__(self, address, city, state, zipcode, pobox_sts, details):
+        self.address = address
+        self.city = sys.intern(city)
+        self.state = sys.intern(state)
+        self.zipcode = sys.intern(zipcode)
+        self.pobox_sts = pobox_sts
+        self.details = tuple(sys.intern(v) if k in self.interned_keys else v
+                             for k, v in zip(DETAIL_KEYS, details))
+
+    @classmethod
+    def from_address(cls, address):
+        """ Builds a CompactAddress from a parsed Address.  Returns CompactAddress. """
+        return cls(address.address, address.city, address.state, address.zipcode,
+                   address.pobox_sts, [address.address_details[k] for k in DETAIL_KEYS])
+
+    @property
+    def address_details(self):
+        return dict(zip(DETAIL_KEYS, self.details))
+
+    def parsed(self):
+        """ Flattened breakdown (address_details plus pobox_sts).  Returns dict(). """
+        return {**self.address_details, 'pobox_sts': self.pobox_sts}
+
+    @property
+    def fingerprint(self):
+        """ Comparison Fingerprint, built fresh on each access.  Returns Fingerprint. """
+        return Fingerprint(self)
+
+    __str__ = Address.__str__
+
+
+def _delimiter_for(path):
+    """ A tab for .tsv files, a comma otherwise. """
+    return '\t' if Path(path).suffix.lower() == '.tsv' else ','
+
+
+def _read_rows(path, delimiter=None):
+    """ Streams dict rows from a CSV/TSV file (delimiter defaults per _delimiter_for).  Fields
+    missing from short rows read as ''. """
+    with open(path, 'r', newline='', buffering=IO_BUFFER) as f_in:
+        yield from DictReader(f_in, delimiter=delimiter or _delimiter_for(path), restval='')
+
+
+def _address_fields(row, columns=None):
+    """ Pulls (address, city, state, zipcode) out of a dict or sequence row.  columns maps
+    each of ADDRESS_COLUMNS to the row's key/index; missing entries default to the column name
+    for dict rows and the positional index for sequence rows. """
+    columns = columns or {}
+    if isinstance(row, dict):
+        return tuple(row[columns.get(c, c)] for c in ADDRESS_COLUMNS)
+    return tuple(row[columns.get(c, n)] for n, c in enumerate(ADDRESS_COLUMNS))
+
+
+def parse_many(source, columns=None, delimiter=None, **address_kwargs):
+    """ Lazily parses many addresses.
+    source: iterable of dict/sequence rows, or a path to a CSV/TSV file
+    columns: optional mapping of address/city/state/zipcode to row keys (see _address_fields)
+    address_kwargs: passed through to Address (lexicon, legacy, ...)
+    Yields dict() of PARSED_FIELDS per row, in input order. """
+    rows = _read_rows(source, delimiter) if isinstance(source, (str, Path)) else source
+    for row in rows:
+        yield Address(*_address_fields(row, columns), **address_kwargs).parsed()
+
+
+def normalize_csv(in_path, out_path, columns=None, delimiter=None, out_delimiter=None,
+                  chunk_size=1000, **address_kwargs):
+    """ Streams in_path through the parser and writes every input column plus PARSED_FIELDS
+    to out_path.  Rows are read, parsed and written chunk_size at a time, so memory stays flat
+    regardless of file size.  The header is written even when in_path has no data rows.  Short
+    rows are padded with '' and fields beyond the header are dropped.
+    Returns number of rows written. """
+    written = 0
+    with open(in_path, 'r', newline='', buffering=IO_BUFFER) as f_in, \
+            open(out_path, 'w', newline='', buffering=IO_BUFFER) as f_out:
+        rows = DictReader(f_in, delimiter=delimiter or _delimiter_for(in_path), restval='')
+        in_fields = list(rows.fieldnames or [])
+        writer = DictWriter(f_out, fieldnames=in_fields + [f for f in PARSED_FIELDS
+                                                           if f not in in_fields],
+                            delimiter=out_delimiter or _delimiter_for(out_path),
+                            extrasaction='ignore')
+        writer.writeheader()
+        chunk = []
+        for row in rows:
+            row.update(Address(*_address_fields(row, columns), **address_kwargs).parsed())
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                writer.writerows(chunk)
+                written += len(chunk)
+                chunk = []
+        writer.writerows(chunk)
+        written += len(chunk)
+    return written
+
+
+def _init_parse_worker(ste_identifiers, sfx_identifiers, address_kwargs):
+    """ Process pool initializer: loads the identifier tables once per worker.  A forked worker
+    also inherits the parent's ExceptionSink and Instrumentation; both are dropped so exception
+    records come back with the results and are recorded by the parent only. """
+    global _worker_kwargs, _exception_sink, _instrumentation
+    load_lexicon(ste_identifiers, sfx_identifiers)
+    _worker_kwargs = address_kwargs
+    _exception_sink = None
+    _instrumentation = None
+
+
+def _parse_chunk(chunk):
+    """ Parses a list of (address, city, state, zipcode) tuples inside a pool worker.
+    Returns list() of parsed dicts, list() of exception records. """
+    results = []
+    exceptions = []
+    for fields in chunk:
+        addr = Address(*fields, **_worker_kwargs)
+        results.append(addr.parsed())
+        exceptions.extend(addr.exceptions)
+    return results, exceptions
+
+
+def parse_parallel(source, columns=None, delimiter=None, workers=None, chunk_size=1000,
+                   exceptions=None, **address_kwargs):
+    """ parse_many across a process pool.  Input is cut into chunk_size pieces that are
+    parsed by workers (default: one per CPU), each of which loads the Lexicon once.  At most
+    two chunks per worker are in flight, so large files stream rather than load whole.
+    exceptions: optional list that receives every exception record raised while parsing
+    Exception records are also passed to the exception_sink keyword (or the process-wide
+    ExceptionSink) here in the parent.
+    Yields dict() of PARSED_FIELDS per row, in input order. """
+    workers = workers or os.cpu_count() or 1
+    lexicon = address_kwargs.pop('lexicon', None) or get_lexicon()
+    exception_sink = address_kwargs.pop('exception_sink', None) or _exception_sink
+    exception_path = lexicon.files_for(address_kwargs.get('wdir', DEFAULT_WDIR))['exception']
+    rows = _read_rows(source, delimiter) if isinstance(source, (str, Path)) else source
+    fields = (_address_fields(row, columns) for row in rows)
+    chunks = iter(lambda: list(islice(fields, chunk_size)), [])
+    init_args = (lexicon.files['ste_identifiers'], lexicon.files['sfx_identifiers'],
+                 address_kwargs)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_parse_worker,
+                             initargs=init_args) as pool:
+        pending = deque(pool.submit(_parse_chunk, chunk)
+                        for chunk in islice(chunks, workers * 2))
+        while pending:
+            results, chunk_exceptions = pending.popleft().result()
+            for chunk in islice(chunks, 1):
+                pending.append(pool.submit(_parse_chunk, chunk))
+            if exceptions is not None:
+                exceptions.extend(chunk_exceptions)
+            if exception_sink is not None and chunk_exceptions:
+                exception_sink.record_many(chunk_exceptions, exception_path)
+            yield from results
+
+
+def _shard_of(fields, shards):
+    """ Shard number for raw (address, city, state, zipcode).  Street addresses are placed by
+    state + zip3 and PO Boxes by state alone, matching what compare requires to agree. """
+    address = Address(*fields, lazy=True)
+    if address.pobox_sts:
+        shard_key = f'PO\x1f{address.state.upper()}'
+    else:
+        shard_key = f'ST\x1f{address.state.upper()}\x1f{address.zipcode[:3]}'
+    return zlib.crc32(shard_key.encode('utf-8')) % shards
+
+
+def _partition(source, shard_paths, columns, delimiter, key):
+    """ Streams source into one CSV per shard as (row id, address, city, state, zipcode).
+    Returns number of rows. """
+    handles = [open(p, 'w', newline='', buffering=IO_BUFFER // 16) for p in shard_paths]
+    try:
+        writers = [csv_writer(h) for h in handles]
+        rows = _read_rows(source, delimiter) if isinstance(source, (str, Path)) else source
+        count = 0
+        for count, row in enumerate(rows, 1):
+            fields = _address_fields(row, columns)
+            row_id = row[key] if key is not None else count - 1
+            writers[_shard_of(fields, len(shard_paths))].writerow((row_id,) + tuple(fields))
+    finally:
+        for handle in handles:
+            handle.close()
+    return count
+
+
+def _link_shard(paths, statuses):
+    """ Matches one left shard against the same right shard.
+    Returns list() of (left id, right id, compare decision) rows, list() of exception records. """
+    left_path, right_path = paths
+    buckets = {}
+    exceptions = []
+    with open(right_path, 'r', newline='', buffering=IO_BUFFER) as right_in:
+        for row in csv_reader(right_in):
+            address = Address(*row[1:], **_worker_kwargs)
+            exceptions.extend(address.exceptions)
+            buckets.setdefault(blocking_key(address), []).append((row[0], address))
+    linked = []
+    with open(left_path, 'r', newline='', buffering=IO_BUFFER) as left_in:
+        for row in csv_reader(left_in):
+            address = Address(*row[1:], **_worker_kwargs)
+            exceptions.extend(address.exceptions)
+            candidates = buckets.get(blocking_key(address))
+            if not candidates:
+                continue
+            decisions = compare_many(address, [c[1] for c in candidates])
+            for (right_id, _), decision in zip(candidates, decisions):
+                if decision['Match_Status'] in statuses:
+                    linked.append((row[0], right_id) + tuple(decision[f] for f in COMPARE_FIELDS))
+    return linked, exceptions
+
+
+def link_files(left, right, out_path, left_columns=None, right_columns=None, left_key=None,
+               right_key=None, delimiter=None, statuses=('Match', 'Potential'), shards=64,
+               shard_dir=None, workers=1, **address_kwargs):
+    """ Record linkage between two address sources (rows or CSV/TSV paths) too large to hold
+    as Address objects.  Both sides are streamed to disk in shards keyed on state + zip3 (state
+    alone for PO Boxes), then each shard pair is parsed, blocked and compared on its own,
+    across workers processes when workers > 1.  Memory is bounded by the largest shard (two
+    per worker in flight when workers > 1).
+    left_key/right_key: row key/index used as the output id (default: 0-based row number)
+    shard_dir: where shard files go (default: a temporary directory, removed afterwards)
+    Writes out_path with left_id, right_id and COMPARE_FIELDS for every pair whose
+    Match_Status is in statuses.  Exception records are passed to the exception_sink keyword
+    (or the process-wide ExceptionSink) here in the parent, whichever process parsed them.
+    Returns dict: left_rows, right_rows, shards, pairs. """
+    global _worker_kwargs, _exception_sink
+    lexicon = address_kwargs.pop('lexicon', None) or get_lexicon()
+    exception_sink = address_kwargs.pop('exception_sink', None) or _exception_sink
+    exception_path = lexicon.files_for(address_kwargs.get('wdir', DEFAULT_WDIR))['exception']
+    with tempfile.TemporaryDirectory(dir=shard_dir) as tmp_dir:
+        left_paths = [str(Path(tmp_dir) / f'left_{n}.csv') for n in range(shards)]
+        right_paths = [str(Path(tmp_dir) / f'right_{n}.csv') for n in range(shards)]
+        left_rows = _partition(left, left_paths, left_columns, delimiter, left_key)
+        right_rows = _partition(right, right_paths, right_columns, delimiter, right_key)
+        work = [paths for paths in zip(left_paths, right_paths)
+                if Path(paths[0]).stat().st_size and Path(paths[1]).stat().st_size]
+        init_args = (lexicon.files['ste_identifiers'], lexicon.files['sfx_identifiers'],
+                     address_kwargs)
+        pairs = 0
+        with open(out_path, 'w', newline='', buffering=IO_BUFFER) as f_out:
+            writer = csv_writer(f_out)
+            writer.writerow(('left_id', 'right_id') + COMPARE_FIELDS)
+            if workers > 1:
+                with ProcessPoolExecutor(max_workers=workers, initializer=_init_parse_worker,
+                                         initargs=init_args) as pool:
+                    # At most two shards per worker in flight, as in parse_parallel, so
+                    # finished shards don't pile up behind a slow one.
+                    shard_work = iter(work)
+                    pending = deque(pool.submit(_link_shard, paths, statuses)
+                                    for paths in islice(shard_work, workers * 2))
+                    while pending:
+                        linked, exceptions = pending.popleft().result()
+                        for paths in islice(shard_work, 1):
+                            pending.append(pool.submit(_link_shard, paths, statuses))
+                        writer.writerows(linked)
+                        pairs += len(linked)
+                        if exception_sink is not None and exceptions:
+                            exception_sink.record_many(exceptions, exception_path)
+            else:
+                previous = _worker_kwargs, _exception_sink
+                _worker_kwargs, _exception_sink = {'lexicon': lexicon, **address_kwargs}, None
+                try:
+                    for paths in work:
+                        linked, exceptions = _link_shard(paths, statuses)
+                        writer.writerows(linked)
+                        pairs += len(linked)
+                        if exception_sink is not None and exceptions:
+                            exception_sink.record_many(exceptions, exception_path)
+                finally:
+                    _worker_kwargs, _exception_sink = previous
+    return {'left_rows': left_rows, 'right_rows': right_rows, 'shards': len(work),
+            'pairs': pairs}
+
+
+class ReferenceStore:
+    """ SQLite store of parsed reference addresses.  Each row keeps its raw fields, a hash of
+        them, its breakdown and its blocking key, alongside the Lexicon version it was parsed
+        with.  sync() re-parses only rows whose raw input changed; if the identifier CSVs
+        changed, the stored rows are dropped and rebuilt from source.  items() loads the stored
+        breakdowns without parsing and candidates() looks them up by blocking_key. """
+
+    columns = ('row_key', 'raw_hash', 'address', 'city', 'state', 'zipcode', 'pobox_sts') \
+        + DETAIL_KEYS + ('blocking_key',)
+
+    def __init__(self, path, lexicon=None):
+        self.path = str(path)
+        self.lexicon = lexicon or get_lexicon()
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, '
+                                'value TEXT)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS addresses ('
+                                + ', '.join(f'{c} TEXT' for c in self.columns)
+                                + ', PRIMARY KEY (row_key))')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS addresses_blocking_key '
+                                'ON addresses (blocking_key)')
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM addresses').fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+    @staticmethod
+    def raw_hash(fields):
+        """ Hash of the raw (address, city, state, zipcode).  Returns str. """
+        return hashlib.sha1('\x1f'.join(str(f) for f in fields).encode('utf-8')).hexdigest()
+
+    def stored_version(self):
+        """ Lexicon version the stored rows were parsed with, or None. """
+        row = self.connection.execute("SELECT value FROM meta WHERE name = 'lexicon_version'")\
+            .fetchone()
+        return row[0] if row else None
+
+    def sync(self, source, columns=None, delimiter=None, key=None, prune=False,
+             batch_size=5000, **address_kwargs):
+        """ Brings the store up to date with source (rows or a CSV/TSV path, as parse_many).
+        key: row key/index holding a stable row id; without one the raw hash is the id
+        prune: delete stored rows that were not in source
+        Rows are always parsed with the store's Lexicon; a different lexicon keyword is refused.
+        Returns dict: unchanged, parsed, removed. """
+        lexicon = address_kwargs.pop('lexicon', None)
+        if lexicon is not None and lexicon is not self.lexicon:
+            raise ValueError('sync parses with the ReferenceStore Lexicon; '
+                             'pass lexicon to ReferenceStore() instead.')
+        stale = self.stored_version() != self.lexicon.version
+        known = {} if stale else dict(self.connection.execute(
+            'SELECT row_key, raw_hash FROM addresses'))
+        if stale:
+            self.connection.execute('DELETE FROM addresses')
+        rows = _read_rows(source, delimiter) if isinstance(source, (str, Path)) else source
+        seen = set()
+        unchanged = parsed = 0
+        batch = []
+        insert = (f'INSERT OR REPLACE INTO addresses ({", ".join(self.columns)}) VALUES ('
+                  + ', '.join('?' * len(self.columns)) + ')')
+        for row in rows:
+            fields = _address_fields(row, columns)
+            raw_hash = self.raw_hash(fields)
+            row_key = str(row[key]) if key is not None else raw_hash
+            seen.add(row_key)
+            if known.get(row_key) == raw_hash:
+                unchanged += 1
+                continue
+            addr = Address(*fields, lexicon=self.lexicon, **address_kwargs)
+            batch.append((row_key, raw_hash) + tuple(fields) + (int(addr.pobox_sts),)
+                         + tuple(addr.address_details[k] for k in DETAIL_KEYS)
+                         + ('\x1f'.join(blocking_key(addr)),))
+            known[row_key] = raw_hash
+            parsed += 1
+            if len(batch) >= batch_size:
+                self.connection.executemany(insert, batch)
+                batch = []
+        self.connection.executemany(insert, batch)
+        removed = 0
+        if prune:
+            gone = [(k,) for k in known if k not in seen]
+            self.connection.executemany('DELETE FROM addresses WHERE row_key = ?', gone)
+            removed = len(gone)
+        self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('lexicon_version', ?)",
+                                (self.lexicon.version,))
+        self.connection.commit()
+        return {'unchanged': unchanged, 'parsed': parsed, 'removed': removed}
+
+    def items(self):
+        """ Streams the stored breakdowns without parsing.
+        Yields (row_key, CompactAddress). """
+        cursor = self.connection.execute(f'SELECT {", ".join(self.columns[:-1])} FROM addresses')
+        for row in cursor:
+            yield self._compact(row)
+
+    def candidates(self, address):
+        """ Stored addresses sharing address's blocking_key, via the blocking_key index.
+        Returns list() of (row_key, CompactAddress). """
+        cursor = self.connection.execute(f'SELECT {", ".join(self.columns[:-1])} FROM addresses '
+                                         'WHERE blocking_key = ?',
+                                         ('\x1f'.join(blocking_key(address)),))
+        return [self._compact(row) for row in cursor]
+
+    @staticmethod
+    def _compact(row):
+        return row[0], CompactAddress(row[2], row[3], row[4], row[5], bool(int(row[6])), row[7:])
+
+    def index(self):
+        """ AddressIndex over every stored address.  Returns AddressIndex. """
+        return AddressIndex(address for _, address in self.items())
+
+
+def _column_values(column, zipcode=False):
+    """ Plain list of str from a pandas Series, NumPy/Arrow array or sequence.  Missing values
+    (None, NaN, pd.NA, NaT) become '' and whole-number floats lose their '.0'.
+    zipcode: zip codes read as numbers are zero-padded back to 5 digits. """
+    if hasattr(column, 'to_pylist'):
+        values = column.to_pylist()
+    elif hasattr(column, 'tolist'):
+        values = column.tolist()
+    else:
+        values = list(column)
+    try:
+        import pandas as pd
+    except ImportError:
+        missing = [v is None or v != v for v in values]
+    else:
+        missing = pd.isna(pd.Series(values, dtype=object)).tolist()
+    width = 5 if zipcode else 0
+    return ['' if m
+            else v if isinstance(v, str)
+            else f'{v:0{width}d}' if isinstance(v, int) and not isinstance(v, bool)
+            else f'{int(v):0{width}d}' if isinstance(v, float) and v.is_integer()
+            else str(v) for v, m in zip(values, missing)]
+
+
+def _as_frame(columns, like=None):
+    """ pandas DataFrame of columns (sharing like's index, if it has one) when pandas is
+    installed, else the dict of lists. """
+    try:
+        import pandas as pd
+    except ImportError:
+        return columns
+    index = getattr(like, 'index', None)
+    return pd.DataFrame(columns, index=None if callable(index) else index)
+
+
+def parse_columns(address, city, state, zipcode, **address_kwargs):
+    """ Parses whole columns (pandas Series, NumPy/Arrow string arrays or sequences) at once.
+    Each distinct (address, city, state, zipcode) is broken down once and its result shared
+    by every row repeating it.
+    Returns DataFrame (dict of lists without pandas) with one column per PARSED_FIELDS,
+    aligned to address's index when it has one. """
+    columns = [_column_values(c) for c in (address, city, state)] \
+        + [_column_values(zipcode, zipcode=True)]
+    if len({len(c) for c in columns}) > 1:
+        raise ValueError('address, city, state and zipcode columns differ in length.')
+    parsed = {}
+    breakdown = []
+    for fields in zip(*columns):
+        values = parsed.get(fields)
+        if values is None:
+            addr = Address(*fields, **address_kwargs)
+            values = tuple(addr.address_details[k] for k in DETAIL_KEYS) + (addr.pobox_sts,)
+            parsed[fields] = values
+        breakdown.append(values)
+    out = {field: [values[n] for values in breakdown] for n, field in enumerate(PARSED_FIELDS)}
+    return _as_frame(out, address)
+
+
+def _column_addresses(side, columns, **address_kwargs):
+    """ CompactAddress per row of a DataFrame/dict of columns, reusing PARSED_FIELDS columns
+    when side already has them.  Returns list(). """
+    columns = columns or {}
+    raw = [_column_values(side[columns.get(c, c)], zipcode=c == 'zipcode')
+           for c in ADDRESS_COLUMNS]
+    if not all(field in side for field in PARSED_FIELDS):
+        side = parse_columns(*raw, **address_kwargs)
+    details = [_column_values(side[k]) for k in DETAIL_KEYS]
+    # pobox_sts read back from a file arrives as text ('False', '0', ''), not bool.
+    pobox = [p.strip().lower() in ('true', '1', 'yes', 'y', 't')
+             for p in _column_values(side['pobox_sts'])]
+    return [CompactAddress(a, c, s, z, p, d)
+            for a, c, s, z, p, *d in zip(*raw, pobox, *details)]
+
+
+def compare_columns(left, right, columns=None, **address_kwargs):
+    """ compare for aligned row pairs of two DataFrames (or dicts of columns) holding
+    address/city/state/zipcode (renamed via columns).  Sides that already carry the
+    parse_columns fields are not parsed again.
+    Returns DataFrame (dict of lists without pandas) with one column per COMPARE_FIELDS,
+    aligned to left's index when it has one. """
+    left_addresses = _column_addresses(left, columns, **address_kwargs)
+    right_addresses = _column_addresses(right, columns, **address_kwargs)
+    if len(left_addresses) != len(right_addresses):
+        raise ValueError('left and right have a different number of rows.')
+    decisions = [_compare_fingerprints(a1.fingerprint, a2.fingerprint)
+                 for a1, a2 in zip(left_addresses, right_addresses)]
+    out = {field: [d[field] for d in decisions] for field in COMPARE_FIELDS}
+    return _as_frame(out, left)
+
+
+def _request_fields(request):
+    """ (address, city, state, zipcode) from a JSON request object, checked to be strings so
+    bad input is a 400 rather than a parser error.  Returns tuple. """
+    if not isinstance(request, dict):
+        raise ValueError('Expected a JSON object with address, city, state and zipcode.')
+    fields = _address_fields(request)
+    invalid = [c for c, v in zip(ADDRESS_COLUMNS, fields) if not isinstance(v, str)]
+    if invalid:
+        raise ValueError(f'Expected strings for {", ".join(invalid)}.')
+    return fields
+
+
+def _attempt(function, *args, **kwargs):
+    """ Returns (True, result) or (False, exception) so one bad row can't sink a batch. """
+    try:
+        return True, function(*args, **kwargs)
+    except Exception as err:
+        return False, err
+
+
+def _parse_batch(rows, address_kwargs):
+    return [_attempt(Address, *row, **address_kwargs) for row in rows]
+
+
+def _compare_batch(pairs, _):
+    return [_attempt(compare, address1, address2) for address1, address2 in pairs]
+
+
+def _match_batch(requests, index):
+    return [_attempt(index.query, address, statuses) for address, statuses in requests]
+
+
+class AddressService:
+    """ asyncio front end for Address, compare and AddressIndex.query.  Concurrent calls are
+        queued per operation and handed to the executor in micro-batches (up to batch_size,
+        waiting at most batch_wait seconds for a batch to fill), so the event loop never runs
+        the parser itself.  Each operation has its own executor: with workers > 1, parse and
+        compare each get a pool of that many processes, otherwise a worker thread; match always
+        runs on a thread since the index lives in this process.  executor, if given, is used
+        for every operation instead (it must be a thread executor when an index is set).
+        serve() exposes the same calls over local HTTP/JSON. """
+
+    operations = ('parse', 'compare', 'match')
+
+    def __init__(self, index=None, executor=None, batch_size=64, batch_wait=0.002,
+                 latency_window=10000, workers=1, **address_kwargs):
+        self.index = index
+        self.executor = executor
+        self.workers = workers
+        self.executors = {}
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.address_kwargs = address_kwargs
+        self.stats = {op: {'requests': 0, 'errors': 0, 'batches': 0, 'batched': 0}
+                      for op in self.operations}
+        self.latencies = {op: deque(maxlen=latency_window) for op in self.operations}
+        self._queues = {}
+        self._tasks = []
+        self._owned_executors = []
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def start(self):
+        """ Starts the batch collectors (done automatically on first call). """
+        if self._tasks:
+            return
+        lexicon = self.address_kwargs.get('lexicon') or get_lexicon()
+        for op in self.operations:
+            if self.executor is not None:
+                self.executors[op] = self.executor
+                continue
+            if op != 'match' and self.workers > 1:
+                executor = ProcessPoolExecutor(
+                    max_workers=self.workers, initializer=_init_parse_worker,
+                    initargs=(lexicon.files['ste_identifiers'], lexicon.files['sfx_identifiers'],
+                              {}))
+            else:
+                executor = ThreadPoolExecutor(max_workers=1,
+                                              thread_name_prefix=f'address_bleach-{op}')
+            self.executors[op] = executor
+            self._owned_executors.append(executor)
+        for op in self.operations:
+            self._queues[op] = asyncio.Queue()
+            self._tasks.append(asyncio.create_task(self._collect(op)))
+
+    async def close(self):
+        """ Stops the collectors and the executors this service created.  Calls still queued or
+        in flight fail with RuntimeError('service closed'). """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for queue in self._queues.values():
+            while not queue.empty():
+                self._fail([queue.get_nowait()])
+        for executor in self._owned_executors:
+            executor.shutdown(wait=False)
+        self._owned_executors = []
+        self.executors = {}
+
+    async def parse(self, address, city, state, zipcode):
+        """ Returns Address. """
+        return await self._submit('parse', (address, city, state, zipcode))
+
+    async def compare(self, address1, address2):
+        """ Returns compare(address1, address2) dict. """
+        return await self._submit('compare', (address1, address2))
+
+    async def match_against_index(self, address, statuses=('Match', 'Potential')):
+        """ Returns self.index.query(address, statuses) list. """
+        if self.index is None:
+            raise ValueError('AddressService has no index to match against.')
+        return await self._submit('match', (address, statuses))
+
+    def metrics(self):
+        """ Returns dict: operation -> requests, errors, batches, mean_batch, queue_depth and
+        p50_ms/p99_ms latency over the most recent latency_window requests. """
+        metrics = {}
+        for op in self.operations:
+            stats = self.stats[op]
+            ordered = sorted(self.latencies[op])
+
+            def percentile(p):
+                if not ordered:
+                    return None
+                return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] / 1e6, 3)
+
+            metrics[op] = {'requests': stats['requests'], 'errors': stats['errors'],
+                           'batches': stats['batches'],
+                           'mean_batch': round(stats['batched'] / stats['batches'], 2)
+                           if stats['batches'] else None,
+                           'queue_depth': self._queues[op].qsize() if op in self._queues else 0,
+                           'p50_ms': percentile(0.50), 'p99_ms': percentile(0.99)}
+        return metrics
+
+    async def _submit(self, op, item):
+        if not self._tasks:
+            await self.start()
+        future = asyncio.get_running_loop().create_future()
+        start = perf_counter_ns()
+        await self._queues[op].put((item, future))
+        try:
+            return await future
+        except Exception:
+            self.stats[op]['errors'] += 1
+            raise
+        finally:
+            self.stats[op]['requests'] += 1
+            self.latencies[op].append(perf_counter_ns() - start)
+
+    async def _collect(self, op):
+        loop = asyncio.get_running_loop()
+        queue = self._queues[op]
+        batch_function, extra = {'parse': (_parse_batch, self.address_kwargs),
+                                 'compare': (_compare_batch, None),
+                                 'match': (_match_batch, self.index)}[op]
+        remote = isinstance(self.executors[op], ProcessPoolExecutor)
+        if op == 'parse' and remote:
+            # Worker processes don't log exceptions (see _init_parse_worker); this one does.
+            extra = {k: v for k, v in extra.items() if k != 'exception_sink'}
+        while True:
+            batch = [await queue.get()]
+            try:
+                if self.batch_wait and queue.qsize() < self.batch_size - 1:
+                    await asyncio.sleep(self.batch_wait)
+                while len(batch) < self.batch_size and not queue.empty():
+                    batch.append(queue.get_nowait())
+                self.stats[op]['batches'] += 1
+                self.stats[op]['batched'] += len(batch)
+                try:
+                    results = await loop.run_in_executor(self.executors[op], batch_function,
+                                                          [item for item, _ in batch], extra)
+                except Exception as err:
+                    results = [(False, err)] * len(batch)
+            except asyncio.CancelledError:
+                self._fail(batch)
+                raise
+            for (_, future), (ok, value) in zip(batch, results):
+                if future.done():
+                    continue
+                if ok:
+                    if op == 'parse' and remote:
+                        value._log_exceptions(self.address_kwargs.get('exception_sink'))
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    @staticmethod
+    def _fail(batch):
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(RuntimeError('service closed'))
+
+    async def _route(self, method, path, body):
+        """ Handles one HTTP request.  Returns (status line, JSON-able payload). """
+        if method == 'GET' and path == '/metrics':
+            return '200 OK', self.metrics()
+        if method != 'POST' or path not in ('/parse', '/compare', '/match'):
+            return '404 Not Found', {'error': f'No route for {method} {path}'}
+        try:
+            request = json.loads(body or b'{}')
+            if path == '/compare':
+                address1, address2 = await asyncio.gather(
+                    self.parse(*_request_fields(request['address1'])),
+                    self.parse(*_request_fields(request['address2'])))
+                return '200 OK', await self.compare(address1, address2)
+            address = await self.parse(*_request_fields(request))
+            if path == '/parse':
+                return '200 OK', address.parsed()
+            matches = await self.match_against_index(
+                address, tuple(request.get('statuses', ('Match', 'Potential'))))
+            return '200 OK', [{**dict(zip(ADDRESS_COLUMNS, (candidate.address, candidate.city,
+                                                            candidate.state,
+                                                            candidate.zipcode))),
+                               **candidate.parsed(), 'decision': decision}
+                              for candidate, decision in matches]
+        except (KeyError, TypeError, ValueError) as err:
+            return '400 Bad Request', {'error': repr(err)}
+        except Exception as err:
+            return '500 Internal Server Error', {'error': repr(err)}
+
+    async def handle_http(self, reader, writer):
+        """ asyncio.start_server callback: minimal HTTP/1.1 with keep-alive and JSON bodies.
+        POST /parse, /match: {address, city, state, zipcode}
+        POST /compare: {address1: {...}, address2: {...}}
+        GET /metrics """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path = request_line.decode('latin-1').split(' ')[:2]
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length') or 0))
+                status, payload = await self._route(method, path, body)
+                data = json.dumps(payload).encode('utf-8')
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                writer.write(f'HTTP/1.1 {status}\r\nContent-Type: application/json\r\n'
+                             f'Content-Length: {len(data)}\r\n'
+                             f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'
+                             .encode('latin-1') + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8080):
+        """ Serves handle_http on host:port until cancelled. """
+        await self.start()
+        server = await asyncio.start_server(self.handle_http, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def run_server(host='127.0.0.1', port=8080, reference=None, **service_kwargs):
+    """ Blocking entry point for the HTTP service.  reference: optional ReferenceStore path
+    whose addresses back /match.  service_kwargs: passed to AddressService (workers, ...). """
+    index = None
+    if reference:
+        with ReferenceStore(reference) as store:
+            index = store.index()
+
+    async def main():
+        async with AddressService(index=index, **service_kwargs) as service:
+            await service.serve(host, port)
+
+    asyncio.run(main())
+
 
-if __name__ == '__main__':
+if __name__ == '__main__' and sys.argv[1:2] == ['serve']:
+    parser = argparse.ArgumentParser(prog='address_bleach.py serve',
+                                     description='Local HTTP/JSON address_bleach service')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--reference', help='ReferenceStore database backing /match')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='processes each for parse and compare (default: one per CPU)')
+    args = parser.parse_args(sys.argv[2:])
+    run_server(args.host, args.port, args.reference, workers=args.workers)
+elif __name__ == '__main__':
     # Test Scenario
     addr1 = Address('4568 East Gradine Drive SUITE J15', 'Seattle', 'WA', '98039')
     print(addr1)
@@ -0,0 +1,209 @@
+from pathlib import Path
+from random import Random
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+
+import address_bleach as ab
+
+
+STREET_NAMES = ['Main', 'Gradine', 'Carolina', 'Bluemound', 'Peaceful Trail', 'Oak', 'Elm',
+                'Martin Luther King', 'Bronx', 'West Side', 'Lake', 'Pine', 'Maple', 'Cedar']
+SUFFIXES = ['ST', 'Street', 'RD', 'Road', 'AVE', 'Avenue', 'DR', 'Drive', 'BLVD', 'LN',
+            'Way', 'CT', 'PKWY', 'HWY', 'PL', 'TRL']
+DIRECTIONALS = ['N', 'S', 'E', 'W', 'NE', 'NW', 'SE', 'SW', 'North', 'South', 'East', 'West']
+SUITES = ['STE', 'Suite', 'APT', 'Unit', 'BLDG', 'FL', 'RM', '#']
+WORD_NUMBERS = ['One', 'Two', 'Five', 'Ten', 'Twelve', 'Twenty']
+CITIES = [('Seattle', 'WA', '98039'), ('Tacoma', 'WA', '98402'), ('Portland', 'OR', '97201'),
+          ('Milwaukee', 'WI', '53202'), ('Bronx', 'NY', '10451'), ('Austin', 'TX', '78701')]
+SUFFIX_SPELLINGS = {'ST': 'Street', 'Street': 'ST', 'RD': 'Road', 'Road': 'RD', 'AVE': 'Avenue',
+                    'Avenue': 'AVE', 'DR': 'Drive', 'Drive': 'DR', 'BLVD': 'Boulevard',
+                    'LN': 'Lane', 'Way': 'WY', 'CT': 'Court', 'PKWY': 'Parkway',
+                    'HWY': 'Highway', 'PL': 'Place', 'TRL': 'Trail'}
+BODY_WORDS = ['Old', 'Upper', 'Lower', 'Little', 'Great']
+SHAPES = ['street', 'po_box', 'p_o_box', 'grid', 'decimal_grid', 'block', 'alpha_suffix',
+          'dash_suffix', 'word_number', 'suite', 'dual_directional']
+
+
+def generate_addresses(count, seed=0):
+    """ Seeded synthetic addresses covering every shape breakdown_details handles.
+    Shapes are dealt round-robin so every size has the same mix.
+    Returns list() of (address, city, state, zipcode). """
+    rnd = Random(seed)
+    rows = []
+    for n in range(count):
+        shape = SHAPES[n % len(SHAPES)]
+        city, state, zipcode = rnd.choice(CITIES)
+        number = str(rnd.randint(1, 99999))
+        body = f'{rnd.choice(STREET_NAMES)} {rnd.choice(SUFFIXES)}'
+        if shape == 'po_box':
+            address = f'PO Box {rnd.randint(1, 9999)}'
+        elif shape == 'p_o_box':
+            address = f'P O Box {rnd.randint(1, 9999)}'
+        elif shape == 'grid':
+            address = f'{rnd.choice("NSEW")}{rnd.randint(1, 99)}{rnd.choice("NSEW")}' \
+                      f'{rnd.randint(10000, 99999)} {body}'
+        elif shape == 'decimal_grid':
+            address = f'{rnd.randint(1, 99)}.{rnd.randint(1, 9)} {body}'
+        elif shape == 'block':
+            address = f'{rnd.randint(100, 999)}-{rnd.randint(10, 99)} {body}'
+        elif shape == 'alpha_suffix':
+            address = f'{number}{rnd.choice("ABCD")} {body}'
+        elif shape == 'dash_suffix':
+            address = f'{number}-{rnd.choice("ABCD")} {body}'
+        elif shape == 'word_number':
+            address = f'{rnd.choice(WORD_NUMBERS)} {body}'
+        elif shape == 'suite':
+            address = f'{number} {body} {rnd.choice(SUITES)} {rnd.randint(1, 999)}'
+        elif shape == 'dual_directional':
+            address = f'{number} {rnd.choice(DIRECTIONALS)} {body} {rnd.choice(DIRECTIONALS)}'
+        else:
+            address = f'{number} {rnd.choice(DIRECTIONALS)} {body}'
+        if rnd.random() < 0.1:
+            zipcode = f'{zipcode}-{rnd.randint(1000, 9999)}'
+        rows.append((address, city, state, zipcode))
+    return rows
+
+
+def perturb(row, rnd):
+    """ A near-duplicate of row that keeps its street number, block/grid, state and zip3 (so
+    compare gets as far as body scoring) while varying suffix spelling, body words, suite,
+    city and zip5.  Returns (address, city, state, zipcode). """
+    address, city, state, zipcode = row
+    tokens = [SUFFIX_SPELLINGS.get(t, t) if rnd.random() < 0.5 else t
+              for t in address.split(' ')]
+    if len(tokens) > 2 and rnd.random() < 0.3:
+        tokens.insert(len(tokens) - 1, rnd.choice(BODY_WORDS))
+    if rnd.random() < 0.3:
+        tokens += [rnd.choice(SUITES), str(rnd.randint(1, 999))]
+    if rnd.random() < 0.3:
+        city = rnd.choice(CITIES)[0]
+        zipcode = f'{zipcode[:3]}{rnd.randint(0, 99):02d}'
+    return ' '.join(tokens), city, state, zipcode
+
+
+def summarize(name, size, latencies_ns, elapsed, peak_bytes):
+    """ Throughput and latency percentiles for one benchmark run.  Returns dict(). """
+    ordered = sorted(latencies_ns)
+
+    def percentile(p):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] / 1000, 2)
+
+    return {'benchmark': name, 'size': size, 'ops': len(ordered),
+            'ops_per_sec': round(len(ordered) / elapsed, 1) if elapsed else None,
+            'p50_us': percentile(0.50), 'p90_us': percentile(0.90),
+            'p99_us': percentile(0.99), 'max_us': percentile(1.0),
+            'peak_mem_bytes': peak_bytes}
+
+
+def bench_parse(rows, **address_kwargs):
+    """ Times Address construction per row, then repeats under tracemalloc for peak memory.
+    Returns dict(), list() of Address. """
+    latencies = []
+    start = time.perf_counter()
+    for row in rows:
+        t0 = time.perf_counter_ns()
+        ab.Address(*row, **address_kwargs)
+        latencies.append(time.perf_counter_ns() - t0)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    addresses = [ab.Address(*row, **address_kwargs) for row in rows]
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return summarize('parse', len(rows), latencies, elapsed, peak), addresses
+
+
+def bench_compare(name, pairs):
+    """ Times compare over pairs of Address.  Returns dict(). """
+    latencies = []
+    start = time.perf_counter()
+    for address1, address2 in pairs:
+        t0 = time.perf_counter_ns()
+        ab.compare(address1, address2)
+        latencies.append(time.perf_counter_ns() - t0)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    for address1, address2 in pairs:
+        ab.compare(address1, address2)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return summarize(name, len(pairs), latencies, elapsed, peak)
+
+
+def bench_compare_many(probes, candidates):
+    """ Times compare_many of each probe against its candidate list; latency is per
+    candidate so it lines up with the compare rows.  Returns dict(). """
+    latencies = []
+    start = time.perf_counter()
+    for probe, group in zip(probes, candidates):
+        t0 = time.perf_counter_ns()
+        ab.compare_many(probe, group)
+        latencies.extend([(time.perf_counter_ns() - t0) // len(group)] * len(group))
+    elapsed = time.perf_counter() - start
+    return summarize('compare_many_matched', sum(len(g) for g in candidates), latencies,
+                     elapsed, None)
+
+
+def bench_memory(addresses):
+    """ Retained bytes per Address and per CompactAddress.  Returns list() of dict(). """
+    results = []
+    for name, build in (('memory_address', lambda a: ab.Address(a.address, a.city, a.state,
+                                                                a.zipcode)),
+                        ('memory_compact', lambda a: a.compact())):
+        tracemalloc.start()
+        kept = [build(a) for a in addresses]
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        results.append({'benchmark': name, 'size': len(kept),
+                        'bytes_per_address': round(current / len(kept), 1)})
+        del kept
+    return results
+
+
+def run(sizes, seed=0, legacy=False):
+    """ Runs the parse and compare benchmarks at each size.  Returns dict(). """
+    ab.get_lexicon()
+    results = []
+    for size in sizes:
+        rows = generate_addresses(size, seed)
+        parse_result, addresses = bench_parse(rows, legacy=legacy)
+        results.append(parse_result)
+        rnd = Random(seed)
+        results.append(bench_compare('compare_random', [(rnd.choice(addresses),
+                                                         rnd.choice(addresses))
+                                                        for _ in addresses]))
+        # Near-duplicates share number/zip3/state, so these pairs reach body scoring.
+        probes = addresses[:max(1, size // 20)]
+        groups = [[ab.Address(*perturb(row, rnd)) for _ in range(20)]
+                  for row in rows[:len(probes)]]
+        results.append(bench_compare('compare_matched', [(probe, candidate)
+                                                         for probe, group in zip(probes, groups)
+                                                         for candidate in group]))
+        results.append(bench_compare_many(probes, groups))
+        results.extend(bench_memory(addresses))
+    return {'meta': {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                     'python': platform.python_version(), 'platform': platform.platform(),
+                     'seed': seed, 'engine': 'legacy' if legacy else 'compiled'},
+            'results': results}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='address_bleach parse/compare benchmarks')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--legacy', action='store_true', help='use breakdown_details')
+    parser.add_argument('--output', default=str(Path.cwd() / 'AddressBleach_Benchmark.json'))
+    args = parser.parse_args()
+    report = run(args.sizes, args.seed, args.legacy)
+    with open(args.output, 'w') as out:
+        json.dump(report, out, indent=2)
+    for result in report['results']:
+        if 'bytes_per_address' in result:
+            print(f"{result['benchmark']:>20} {result['size']:>8}: "
+                  f"{result['bytes_per_address']} bytes/address")
+            continue
+        print(f"{result['benchmark']:>20} {result['size']:>8}: {result['ops_per_sec']:>10} ops/s"
+              f"  p50 {result['p50_us']}us  p99 {result['p99_us']}us"
+              f"  peak {result['peak_mem_bytes']} B")
@@ -0,0 +1,472 @@
+from csv import DictReader
+from concurrent.futures import ThreadPoolExecutor
+from random import Random
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import address_bleach as ab
+from address_bleach_benchmark import generate_addresses, perturb
+
+
+TOKENS = ['123', '123B', '123-B', '110-10', '12-5', '-5', 'N6W23001', '39.2', 'one', 'N', 's',
+          'East', 'west', 'NW', 'Main', 'ST', 'Street', 'st', 'Trail', 'RD', 'Dr', 'Drive',
+          'Carolina', 'STE', 'Suite', '#', '#5', 'APT', '12', 'J15', 'FL', '3', '', 'Unit', 'B',
+          'A-1', 'Peaceful', 'AVE', 'ROOM', 'Frnt', 'PO', 'BOX', 'P', 'O', 'a1', '1a2']
+
+
+def near_duplicates(size=400, group=10, seed=0):
+    """ Seeded addresses plus perturbed copies of each.  Returns list() of rows. """
+    rnd = Random(seed)
+    rows = generate_addresses(size, seed)
+    return rows + [perturb(row, rnd) for row in rows for _ in range(group)]
+
+
+def test_compiled_breakdown_matches_legacy():
+    rnd = Random(0)
+    addresses = [row[0] for row in generate_addresses(2000)]
+    addresses += [' '.join(rnd.choice(TOKENS) for _ in range(rnd.randint(1, 7)))
+                  for _ in range(5000)]
+    for address in addresses:
+        legacy = ab.Address(address, 'Seattle', 'WA', '98039', legacy=True)
+        compiled = ab.Address(address, 'Seattle', 'WA', '98039')
+        assert (compiled.pobox_sts, compiled.address_details, compiled.exceptions) \
+            == (legacy.pobox_sts, legacy.address_details, legacy.exceptions), address
+
+
+def test_parse_many_matches_address(tmp_path):
+    rows = generate_addresses(200, 4)
+    expected = [ab.Address(*row).parsed() for row in rows]
+    assert list(ab.parse_many(rows)) == expected
+    in_path = tmp_path / 'in.csv'
+    in_path.write_text('address,city,state,zipcode\n'
+                       + ''.join(','.join(row) + '\n' for row in rows))
+    assert list(ab.parse_many(in_path)) == expected
+
+
+def test_normalize_csv_header_only_and_ragged_rows(tmp_path):
+    in_path, out_path = tmp_path / 'in.csv', tmp_path / 'out.csv'
+    in_path.write_text('id,address,city,state,zipcode\n')
+    assert ab.normalize_csv(in_path, out_path) == 0
+    assert out_path.read_text().splitlines() \
+        == [','.join(('id',) + ab.ADDRESS_COLUMNS + ab.PARSED_FIELDS)]
+    in_path.write_text('id,address,city,state,zipcode\n'
+                       '1,123 Main ST,Seattle,WA,98039,extra,fields\n'
+                       '2,PO Box 12,Tacoma,WA\n'
+                       '3,12 N Elm RD,Portland,OR,97201\n')
+    assert ab.normalize_csv(in_path, out_path, chunk_size=2) == 3
+    with open(out_path, newline='') as f_in:
+        rows = list(DictReader(f_in))
+    assert [row['id'] for row in rows] == ['1', '2', '3']
+    assert rows[0]['street_num'] == '123' and rows[0]['street_body'] == 'Main'
+    assert rows[1]['zipcode'] == '' and rows[1]['pobox_sts'] == 'True'
+    assert rows[2]['street_directional'] == 'N'
+
+
+def test_parse_parallel_keeps_input_order():
+    rows = generate_addresses(500, 5) + [('91627 NW West Side TRL West', 'Austin', 'TX', '78701')]
+    exceptions = []
+    results = list(ab.parse_parallel(rows, workers=2, chunk_size=37, exceptions=exceptions))
+    assert results == list(ab.parse_many(rows))
+    assert exceptions == [e for row in rows for e in ab.Address(*row).exceptions]
+    assert len(exceptions) >= 1
+
+
+def test_address_index_matches_brute_force():
+    addresses = [ab.Address(*row) for row in near_duplicates(200, 5, seed=1)]
+    index = ab.AddressIndex(addresses)
+    statuses = ('Match', 'Potential')
+    for probe in addresses[::7]:
+        expected = [(candidate, decision) for candidate in addresses
+                    for decision in [ab.compare(probe, candidate)]
+                    if decision['Match_Status'] in statuses]
+        found = index.query(probe, statuses)
+        assert sorted(map(repr, found)) == sorted(map(repr, expected))
+
+
+def test_dedupe_clusters_and_representatives(tmp_path):
+    rows = [('123 Main ST', 'Seattle', 'WA', '98039'), ('500 Oak AVE', 'Seattle', 'WA', '98039'),
+            ('123 Main Street', 'Seattle', 'WA', '98039'), ('PO Box 12', 'Tacoma', 'WA', '98402'),
+            ('P O Box 12', 'Tacoma', 'WA', '98402'),
+            ('123 N Main ST STE 4', 'Seattle', 'WA', '98039'),
+            ('123 Main ST', 'Portland', 'OR', '97201')]
+    result = ab.dedupe((ab.Address(*row) for row in rows), shard_dir=tmp_path)
+    assert list(result['cluster_ids']) == [0, 1, 0, 3, 3, 0, 6]
+    assert result['representatives'] == {0: 5, 3: 3}
+    assert result['summary'] == {'rows': 7, 'clusters': 4, 'duplicate_clusters': 2,
+                                 'duplicate_rows': 3, 'comparisons': 3}
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_dedupe_matches_brute_force_components():
+    addresses = [ab.Address(*row) for row in near_duplicates(60, 4, seed=6)]
+    parent = list(range(len(addresses)))
+
+    def find(i):
+        while parent[i] != i:
+            i = parent[i]
+        return i
+
+    for i, address1 in enumerate(addresses):
+        for j in range(i + 1, len(addresses)):
+            if ab.compare(address1, addresses[j])['Match_Status'] == 'Match':
+                a, b = sorted((find(i), find(j)))
+                parent[b] = a
+    expected = [min(k for k in range(len(addresses)) if find(k) == find(i))
+                for i in range(len(addresses))]
+    for shards in (1, 7):
+        assert list(ab.dedupe(iter(addresses), shards=shards)['cluster_ids']) == expected
+
+
+def test_parse_cache_hit_matches_fresh_parse():
+    cache = ab.ParseCache()
+    spellings = ['123 MAIN ST', '123 Main St', '123  Main St', ' 123 main st ', '123 Main ST']
+    for address in spellings * 2:
+        cached = ab.Address(address, 'Seattle', 'WA', '98039', cache=cache)
+        fresh = ab.Address(address, 'Seattle', 'WA', '98039')
+        assert (cached.pobox_sts, cached.address_details, cached.exceptions) \
+            == (fresh.pobox_sts, fresh.address_details, fresh.exceptions), address
+    assert cache.stats()['hits'] == len(spellings)
+    other = ab.Address('123 Main Street', 'Seattle', 'WA', '98039')
+    assert ab.compare(ab.Address('123 Main St', 'Seattle', 'WA', '98039', cache=cache), other) \
+        == ab.compare(ab.Address('123 Main St', 'Seattle', 'WA', '98039'), other)
+
+
+def test_parse_cache_keys_engine_and_lexicon():
+    cache = ab.ParseCache()
+    ab.Address('12 N Elm RD', 'Portland', 'OR', '97201', cache=cache)
+    ab.Address('12 N Elm RD', 'Portland', 'OR', '97201', cache=cache, legacy=True)
+    lexicon = ab.get_lexicon()
+    assert set(cache.entries) \
+        == {(lexicon.version, legacy, '12 N Elm RD', 'Portland', 'OR', '97201')
+            for legacy in (False, True)}
+
+
+def test_parse_cache_eviction_and_stats():
+    cache = ab.ParseCache(maxsize=2)
+    rows = [('1 A ST', 'X', 'WA', '98039'), ('2 B ST', 'X', 'WA', '98039'),
+            ('3 C ST', 'X', 'WA', '98039')]
+    ab.Address(*rows[0], cache=cache)
+    ab.Address(*rows[1], cache=cache)
+    ab.Address(*rows[0], cache=cache)
+    ab.Address(*rows[2], cache=cache)
+    assert cache.stats() == {'hits': 1, 'misses': 3, 'evictions': 1, 'size': 2, 'maxsize': 2}
+    assert [key[2] for key in cache.entries] == ['1 A ST', '3 C ST']
+    cache.clear()
+    assert cache.stats() == {'hits': 0, 'misses': 0, 'evictions': 0, 'size': 0, 'maxsize': 2}
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_compare_many_matches_compare(compact):
+    addresses = [ab.Address(*row) for row in near_duplicates(100, 10)]
+    if compact:
+        addresses = [address.compact() for address in addresses]
+    for probe in addresses[:100]:
+        candidates = addresses[100:]
+        assert ab.compare_many(probe, candidates) \
+            == [ab.compare(probe, candidate) for candidate in candidates]
+
+
+@pytest.mark.parametrize('edit', [lambda a: setattr(a, 'state', 'OR'),
+                                  lambda a: setattr(a, 'city', 'Tacoma'),
+                                  lambda a: setattr(a, 'zipcode', '98402'),
+                                  lambda a: setattr(a, 'pobox_sts', True),
+                                  lambda a: a.address_details.__setitem__('street_num', '999'),
+                                  lambda a: a.address_details.update(street_body='Elm')])
+def test_fingerprint_follows_edits(edit):
+    address = ab.Address('123 Main ST', 'Seattle', 'WA', '98039')
+    other = ab.Address('123 Main Street', 'Seattle', 'WA', '98039')
+    assert ab.compare_many(address, [other])[0]['Match_Status'] == 'Match'
+    assert ab.compare_many(other, [address])[0]['Match_Status'] == 'Match'
+    edit(address)
+    assert ab.compare_many(address, [other]) == [ab.compare(address, other)]
+    assert ab.compare_many(other, [address]) == [ab.compare(other, address)]
+
+
+def test_address_index_keeps_compact_fingerprints():
+    addresses = [ab.Address(*row) for row in near_duplicates(50, 5, seed=7)]
+    index = ab.AddressIndex(address.compact() for address in addresses)
+    for probe in addresses:
+        expected = [(str(c), d) for c in index.candidates(probe)
+                    for d in [ab.compare(probe, c)] if d['Match_Status'] != 'No Match']
+        assert [(str(c), d) for c, d in index.query(probe)] == expected
+    fingerprints = index.fingerprints[ab.blocking_key(addresses[0])]
+    index.query(addresses[0])
+    assert index.fingerprints[ab.blocking_key(addresses[0])] is fingerprints
+    index.add(addresses[0].compact())
+    assert len(fingerprints) == len(index.candidates(addresses[0]))
+
+
+def test_instrumentation_counts_across_threads():
+    rows = [row for row in generate_addresses(400, 8) if 'Box' not in row[0]]
+    instrumentation = ab.enable_instrumentation(sample_size=50)
+    try:
+        threads = [threading.Thread(target=lambda: [ab.Address(*row) for row in rows])
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            ab.instrumentation_snapshot()
+        for thread in threads:
+            thread.join()
+        snapshot = ab.instrumentation_snapshot()
+    finally:
+        assert ab.disable_instrumentation() is instrumentation
+    assert {stage: s['calls'] for stage, s in snapshot['stages'].items()} \
+        == dict.fromkeys(('find_suite', 'grid_block', 'find_street_num',
+                          'identify_street_suffix', 'find_directional'), 4 * len(rows))
+    assert all(len(samples) == 50 for samples in instrumentation.samples.values())
+    assert ab.instrumentation_snapshot() == {'stages': {}, 'counters': {}}
+
+
+BAD_ROW = ('91627 NW West Side TRL West', 'Austin', 'TX', '78701')
+
+
+def read_counts(path):
+    with open(path, newline='') as f_in:
+        return {(row['Address'], row['Exception']): int(row['Count']) for row in DictReader(f_in)}
+
+
+def test_exception_sink_counts_and_paths(tmp_path):
+    wdir1, wdir2 = tmp_path / 'one', tmp_path / 'two'
+    wdir1.mkdir()
+    wdir2.mkdir()
+    other = ('1 N S E ST W', 'Austin', 'TX', '78701')
+    with ab.ExceptionSink(batch_size=2) as sink:
+        for _ in range(5):
+            ab.Address(*BAD_ROW, wdir=str(wdir1), exception_sink=sink)
+        ab.Address(*other, wdir=str(wdir2), exception_sink=sink)
+        ab.Address('123 Main ST', 'Seattle', 'WA', '98039', wdir=str(wdir2), exception_sink=sink)
+    message = 'More than 2 potential Directionals exist in address.'
+    assert read_counts(wdir1 / ab.EXCEPTION_FILE) == {(BAD_ROW[0], message): 5}
+    assert read_counts(wdir2 / ab.EXCEPTION_FILE) == {(other[0], message): 1}
+    assert sink.recorded == 6
+    single = tmp_path / 'all.csv'
+    with ab.ExceptionSink(path=single) as sink:
+        ab.Address(*BAD_ROW, wdir=str(wdir1), exception_sink=sink)
+        ab.Address(*other, wdir=str(wdir2), exception_sink=sink)
+    assert read_counts(single) == {(BAD_ROW[0], message): 1, (other[0], message): 1}
+
+
+def test_exception_sink_fresh_report_unless_appending(tmp_path):
+    path = tmp_path / 'exceptions.csv'
+    for expected, append in ((1, False), (1, False), (2, True), (3, True), (1, False)):
+        with ab.ExceptionSink(path=path, append=append) as sink:
+            ab.Address(*BAD_ROW, exception_sink=sink)
+        assert list(read_counts(path).values()) == [expected]
+
+
+def test_exception_sink_custom_writer_and_global_sink():
+    reports = []
+    sink = ab.ExceptionSink(writer=lambda path, rows: reports.append((path, rows)))
+    previous = ab.set_exception_sink(sink)
+    try:
+        ab.Address(*BAD_ROW)
+        ab.Address(*BAD_ROW, wdir='/elsewhere')
+    finally:
+        assert ab.set_exception_sink(previous) is sink
+    sink.close()
+    files_for = ab.get_lexicon().files_for
+    assert sorted((path, rows[0]['Count']) for path, rows in reports) \
+        == sorted((files_for(wdir)['exception'], 1) for wdir in (ab.DEFAULT_WDIR, '/elsewhere'))
+
+
+def test_lazy_address_skips_breakdown_on_cheap_rejection():
+    probe = ab.Address('123 Main ST', 'Seattle', 'WA', '98039')
+    other_state = ab.Address('123 Main ST', 'Portland', 'OR', '97201', lazy=True)
+    po_box = ab.Address('PO Box 12', 'Seattle', 'WA', '98039', lazy=True)
+    same_state = ab.Address('123 Main Street', 'Seattle', 'WA', '98039', lazy=True)
+    assert po_box.evaluated and not other_state.evaluated and not same_state.evaluated
+    decisions = ab.compare_many(probe, [other_state, po_box, same_state])
+    assert [d['Match_Status'] for d in decisions] == ['No Match', 'No Match', 'Match']
+    assert not other_state.evaluated and same_state.evaluated
+    assert other_state.address_details \
+        == ab.Address('123 Main ST', 'Portland', 'OR', '97201').address_details
+    assert other_state.evaluated
+
+
+def test_reference_store_incremental_sync(tmp_path):
+    rows = [(str(n),) + row for n, row in enumerate(generate_addresses(300, 3))]
+    duplicated = [row[1:] for row in rows[:20]] * 2
+    with ab.ReferenceStore(tmp_path / 'duplicates.db') as store:
+        assert store.sync(duplicated) == {'unchanged': 20, 'parsed': 20, 'removed': 0}
+    columns = dict(zip(ab.ADDRESS_COLUMNS, range(1, 5)))
+    path = tmp_path / 'reference.db'
+    with ab.ReferenceStore(path) as store:
+        assert store.sync(rows, columns=columns, key=0) \
+            == {'unchanged': 0, 'parsed': 300, 'removed': 0}
+        assert store.sync(rows, columns=columns, key=0) \
+            == {'unchanged': 300, 'parsed': 0, 'removed': 0}
+        changed = list(rows)
+        changed[5] = ('5', '742 Evergreen Terrace', 'Springfield', 'OR', '97477')
+        del changed[10]
+        assert store.sync(changed, columns=columns, key=0, prune=True) \
+            == {'unchanged': 298, 'parsed': 1, 'removed': 1}
+        assert len(store) == 299
+        stored = dict(store.items())
+        for row_key, *fields in changed:
+            assert stored[row_key].address_details == ab.Address(*fields).address_details
+        probe = ab.Address(*changed[5][1:])
+        assert [key for key, _ in store.candidates(probe)] == ['5']
+    with sqlite3.connect(path) as connection:
+        connection.execute("UPDATE meta SET value = 'stale' WHERE name = 'lexicon_version'")
+    with ab.ReferenceStore(path) as store:
+        assert store.sync(changed, columns=columns, key=0)['parsed'] == 299
+        with pytest.raises(ValueError):
+            store.sync(changed, columns=columns, key=0, lexicon=ab.Lexicon())
+        assert store.stored_version() == store.lexicon.version
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_link_files_matches_brute_force(tmp_path, workers):
+    rows = near_duplicates(150, 4, seed=2)
+    left, right = rows[::2], rows[1::2]
+    out_path = tmp_path / 'linked.csv'
+    left.append(BAD_ROW)
+    right.append(BAD_ROW)
+    reports = []
+    sink = ab.ExceptionSink(writer=lambda path, rows: reports.extend(rows))
+    result = ab.link_files(left, right, out_path, shards=8, shard_dir=tmp_path, workers=workers,
+                           exception_sink=sink)
+    sink.close()
+    assert [row['Count'] for row in reports] == [2]
+    left_addresses = [ab.Address(*row) for row in left]
+    right_addresses = [ab.Address(*row) for row in right]
+    expected = set()
+    for left_id, address1 in enumerate(left_addresses):
+        for right_id, address2 in enumerate(right_addresses):
+            status = ab.compare(address1, address2)['Match_Status']
+            if status in ('Match', 'Potential'):
+                expected.add((str(left_id), str(right_id), status))
+    with open(out_path, newline='') as f_in:
+        linked = {(r['left_id'], r['right_id'], r['Match_Status']) for r in DictReader(f_in)}
+    assert linked == expected
+    assert result['pairs'] == len(expected)
+    assert (result['left_rows'], result['right_rows']) == (len(left), len(right))
+
+
+def test_fuzzy_index_finds_typos():
+    addresses = [ab.Address(*row) for row in generate_addresses(300, 9)]
+    target = ab.Address('4521 N Gradine ST', 'Seattle', 'WA', '98039')
+    index = ab.FuzzyIndex(addresses + [target])
+    assert len(index) == 301
+    assert index.nearest(target, 1) == [(target, 1.0)]
+    found = index.nearest(ab.Address('4512 N Gradien Street', 'Seattle', 'WA', '98039'), 3)
+    assert found[0][0] is target
+    assert [score for _, score in found] == sorted((score for _, score in found), reverse=True)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_address_service_parse_compare_match(workers):
+    rows = generate_addresses(300, 10)
+
+    async def main():
+        index = ab.AddressIndex([ab.Address(*rows[0])])
+        async with ab.AddressService(index=index, workers=workers, batch_size=16) as service:
+            parsed = await asyncio.gather(*(service.parse(*row) for row in rows))
+            decision = await service.compare(parsed[0], parsed[1])
+            matches = await service.match_against_index(parsed[0])
+            metrics = service.metrics()
+        return parsed, decision, matches, metrics
+
+    parsed, decision, matches, metrics = asyncio.run(main())
+    assert [a.parsed() for a in parsed] == [ab.Address(*row).parsed() for row in rows]
+    assert parsed[0].lexicon is ab.get_lexicon()
+    assert decision == ab.compare(ab.Address(*rows[0]), ab.Address(*rows[1]))
+    assert [d['Match_Status'] for _, d in matches] == ['Match']
+    assert metrics['parse']['requests'] == len(rows) and metrics['parse']['errors'] == 0
+    assert metrics['parse']['batches'] < len(rows)
+
+
+def test_address_service_errors():
+    async def main():
+        async with ab.AddressService() as service:
+            with pytest.raises(AttributeError):
+                await service.parse(None, 'Seattle', 'WA', '98039')
+            assert (await service.parse('PO Box 1', 'Seattle', 'WA', '98039')).pobox_sts
+            bad_field = {'address': None, 'city': 'Seattle', 'state': 'WA', 'zipcode': '98039'}
+            responses = [await service._route('POST', path, json.dumps(body).encode())
+                         for path, body in (('/parse', bad_field), ('/parse', ['1 Main ST']),
+                                            ('/compare', {'address1': {}}))]
+            responses.append(await service._route('GET', '/nowhere', b''))
+            return responses, service.metrics()['parse']
+
+    responses, metrics = asyncio.run(main())
+    assert [status for status, _ in responses] \
+        == ['400 Bad Request', '400 Bad Request', '400 Bad Request', '404 Not Found']
+    assert metrics['errors'] == 1
+
+
+def test_address_service_close_fails_pending_calls():
+    async def main():
+        blocker = ThreadPoolExecutor(max_workers=1)
+        service = ab.AddressService(executor=blocker, batch_size=2, batch_wait=0)
+        await service.start()
+        blocker.submit(time.sleep, 0.2)
+        calls = [asyncio.create_task(service.parse('1 Main ST', 'Seattle', 'WA', '98039'))
+                 for _ in range(5)]
+        await asyncio.sleep(0.05)
+        await service.close()
+        results = await asyncio.wait_for(asyncio.gather(*calls, return_exceptions=True), 5)
+        blocker.shutdown()
+        return results
+
+    results = asyncio.run(main())
+    assert [str(r) for r in results] == ['service closed'] * 5
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def records(columns):
+    """ Rows of a parse_columns/compare_columns result, with or without pandas. """
+    if hasattr(columns, 'to_dict'):
+        return columns.to_dict('records')
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+
+def records_by_column(columns):
+    return {field: [row[field] for row in records(columns)] for field in ab.PARSED_FIELDS}
+
+
+def test_parse_columns_numeric_zips_and_missing_values():
+    parsed = ab.parse_columns(['1 Main ST', 'PO Box 5', None, '1 Main ST'],
+                              ['Boston', 'Boston', float('nan'), 'Boston'],
+                              ['MA', 'MA', 'MA', 'MA'], [2134, 2134.0, None, '02134'])
+    expected = [ab.Address('1 Main ST', 'Boston', 'MA', '02134').parsed(),
+                ab.Address('PO Box 5', 'Boston', 'MA', '02134').parsed(),
+                ab.Address('', '', 'MA', '').parsed(),
+                ab.Address('1 Main ST', 'Boston', 'MA', '02134').parsed()]
+    assert records(parsed) == expected
+
+
+def test_compare_columns_reads_text_pobox_and_numeric_zips():
+    left = {'address': ['1 Main ST', 'PO Box 5'], 'city': ['Boston', 'Boston'],
+            'state': ['MA', 'MA'], 'zipcode': [2134, 2134]}
+    right = {'address': ['1 Main Street', 'PO Box 5'], 'city': ['Cambridge', 'Boston'],
+             'state': ['MA', 'MA'], 'zipcode': ['02134', '02134']}
+    stored = {**records_by_column(ab.parse_columns(*right.values())), **right,
+              'pobox_sts': ['False', 'True']}
+    assert records(ab.compare_columns(left, stored)) \
+        == [ab.compare(ab.Address('1 Main ST', 'Boston', 'MA', '02134'),
+                       ab.Address('1 Main Street', 'Cambridge', 'MA', '02134')),
+            ab.compare(ab.Address('PO Box 5', 'Boston', 'MA', '02134'),
+                       ab.Address('PO Box 5', 'Boston', 'MA', '02134'))]
+
+
+def test_columns_with_pandas_missing_values():
+    pd = pytest.importorskip('pandas')
+    frame = pd.DataFrame({'address': pd.Series(['1 Main ST', pd.NA], dtype='string'),
+                          'city': ['Boston', None], 'state': ['MA', 'MA'],
+                          'zipcode': pd.Series([2134, pd.NA], dtype='Int64')})
+    frame.index = [10, 20]
+    parsed = ab.parse_columns(frame.address, frame.city, frame.state, frame.zipcode)
+    assert list(parsed.index) == [10, 20]
+    assert parsed.loc[10].to_dict() == ab.Address('1 Main ST', 'Boston', 'MA', '02134').parsed()
+    decisions = ab.compare_columns(frame, pd.concat([frame, parsed.astype(str)], axis=1))
+    assert list(decisions.index) == [10, 20]
+    assert records(decisions) \
+        == [ab.compare(ab.Address(*row), ab.Address(*row))
+            for row in (('1 Main ST', 'Boston', 'MA', '02134'), ('', '', 'MA', ''))]